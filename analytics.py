@@ -0,0 +1,164 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+CMJ_EXERCISE = "Countermovement Jump"
+FORMULAS = {"Epley": "e1rm_epley", "Brzycki": "e1rm_brzycki", "RPE": "e1rm_rpe"}
+RPE_PATTERN = r"(?i)RPE\s*[:=]?\s*(\d+(?:\.\d+)?)"
+
+
+def e1rm(weight, reps, formula="Epley", rpe=10):
+    """向量化的 1RM 估算；weight / reps / rpe 可為純量或陣列。
+
+    - Epley：W × (1 + 0.0333 × R)
+    - Brzycki：W × 36 / (37 − R)，R ≥ 37 時無意義
+    - RPE：把保留次數 (10 − RPE) 加回次數後套 Epley
+    """
+    w = np.asarray(weight, dtype=float)
+    r = np.asarray(reps, dtype=float)
+    if formula == "Brzycki":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(r < 37, w * 36 / (37 - r), np.nan)
+    if formula == "RPE":
+        r = r + (10 - np.asarray(rpe, dtype=float))
+    return w * (1 + 0.0333 * r)
+
+
+def parse_rpe(notes):
+    """備註中寫的 RPE（例如「RPE 8」、「rpe:8.5」）；沒寫的組為 NaN。"""
+    notes = notes.astype(str)
+    rpe = pd.Series(np.nan, index=notes.index)
+    has = notes.str.contains("rpe", case=False, regex=False)
+    if has.any(): rpe[has] = pd.to_numeric(notes[has].str.extract(RPE_PATTERN, expand=False), errors="coerce")
+    return rpe.where(rpe.between(1, 10))
+
+
+def prepare_sets(df):
+    # 原始 History 列 -> 數值化的每組資料；只在新增的列上做一次
+    if df.empty or not {"StudentID", "Exercise", "Date"}.issubset(df.columns): return None
+    w = pd.to_numeric(df.get("Weight"), errors="coerce")
+    r = pd.to_numeric(df.get("Reps"), errors="coerce")
+    # 沒有 RPE 的組不估 RPE 版 e1RM（否則與 Epley 完全相同）
+    if "RPE" in df: rpe = pd.to_numeric(df["RPE"], errors="coerce")
+    else: rpe = parse_rpe(df["Note"]) if "Note" in df else np.nan
+    out = pd.DataFrame({
+        "student": df["StudentID"].astype(str).to_numpy(),
+        "exercise": df["Exercise"].astype(str).to_numpy(),
+        "date": pd.to_datetime(df["Date"], errors="coerce").dt.normalize().to_numpy(),
+        "weight": w.to_numpy(), "reps": r.to_numpy(),
+        "rpe": rpe if np.isscalar(rpe) else rpe.to_numpy(dtype=float),
+    })
+    for name, col in FORMULAS.items():
+        out[col] = e1rm(out["weight"], out["reps"], name, rpe if np.isscalar(rpe) else rpe.to_numpy())
+    out["tonnage"] = (out["weight"].fillna(0) * out["reps"].fillna(0))
+    out["sets"] = 1
+    return out.dropna(subset=["date"])
+
+
+_AGG = {**{c: "max" for c in FORMULAS.values()}, "reps_best": "max", "tonnage": "sum", "reps": "sum", "sets": "sum"}
+
+
+class HistoryAnalytics:
+    """History 的預先彙總：每 (學生, 動作, 日期) 一列的最佳 e1RM、CMJ、訓練量與噸位。
+
+    新增列時只彙總新的部分再與既有結果合併，圖表直接以 (學生, 動作) 索引取用，
+    不必每次 rerun 重新掃描整份歷史紀錄。
+    """
+
+    def __init__(self):
+        self.daily = pd.DataFrame()
+        self._epoch, self._pos = None, 0
+        self._lock = threading.Lock()
+
+    def sync(self, table):
+        """從 TableCache 取得上次之後合併進來的列並增量更新。"""
+        if table is None: return
+        with self._lock:
+            epoch, pos, rows, rebuild = table.changes_since(self._epoch, self._pos)
+            if rebuild: self.daily = pd.DataFrame()
+            self._epoch, self._pos = epoch, pos
+            self._add(rows)
+
+    def _add(self, df):
+        sets = prepare_sets(df)
+        if sets is None or sets.empty: return
+        agg = sets.assign(reps_best=sets["reps"]).groupby(["student", "exercise", "date"]).agg(_AGG)
+        if not self.daily.empty:
+            agg = pd.concat([self.daily, agg]).groupby(level=[0, 1, 2]).agg(_AGG)
+        self.daily = agg.sort_index()
+
+    # --- 查詢 ---
+    def _slice(self, student, exercise):
+        if self.daily.empty: return pd.DataFrame()
+        try:
+            if student is None: return self.daily.xs(exercise, level="exercise")
+            return self.daily.loc[(student, exercise)]
+        except KeyError: return pd.DataFrame()
+
+    def e1rm_series(self, student, exercise, formula="Epley"):
+        """每日最佳 e1RM；student 為 None 時取所有學生當日最大值。"""
+        df = self._slice(student, exercise)
+        if df.empty: return pd.DataFrame(columns=["Date", "1RM"])
+        s = df[FORMULAS[formula]].groupby(level="date").max().dropna()
+        return s.rename("1RM").rename_axis("Date").reset_index()
+
+    def cmj_series(self, student):
+        df = self._slice(student, CMJ_EXERCISE)
+        if df.empty: return pd.DataFrame(columns=["Date", "Reps"])
+        return df["reps_best"].groupby(level="date").max().rename("Reps").rename_axis("Date").reset_index()
+
+    def load_series(self, student, window=7):
+        """每日訓練量 / 噸位與 window 天滾動總和（不含 CMJ 檢測）。"""
+        if self.daily.empty: return pd.DataFrame(columns=["Date", "tonnage", "reps", "sets", "rolling_tonnage", "rolling_reps"])
+        df = self.daily
+        df = df[df.index.get_level_values("exercise") != CMJ_EXERCISE]
+        if student is not None:
+            try: df = df.xs(student, level="student")
+            except KeyError: return pd.DataFrame(columns=["Date", "tonnage", "reps", "sets", "rolling_tonnage", "rolling_reps"])
+        day = df[["tonnage", "reps", "sets"]].groupby(level="date").sum()
+        day = day.asfreq("D", fill_value=0) if len(day) else day
+        day["rolling_tonnage"] = day["tonnage"].rolling(window, min_periods=1).sum()
+        day["rolling_reps"] = day["reps"].rolling(window, min_periods=1).sum()
+        return day.rename_axis("Date").reset_index()
+
+
+# ==========================================
+# 訓練日誌（分頁）
+# ==========================================
+LOG_COLUMNS = ["StudentID", "Exercise", "Weight", "Reps", "Note"]
+
+
+def filter_log(df, student=None, plans=None, exercises=None, start=None, end=None):
+    """依學生 / 計畫 / 動作 / 日期範圍篩選 History；日期只對篩選後的子集合解析。"""
+    if df.empty: return df
+    mask = pd.Series(True, index=df.index)
+    if student: mask &= df["StudentID"] == student
+    if plans and "Plan" in df: mask &= df["Plan"].isin(plans)
+    if exercises: mask &= df["Exercise"].isin(exercises)
+    out = df[mask]
+    dates = pd.to_datetime(out["Date"], errors="coerce").dt.normalize()
+    keep = dates.notna()
+    if start is not None: keep &= dates >= pd.Timestamp(start)
+    if end is not None: keep &= dates <= pd.Timestamp(end)
+    return out.assign(Date=dates)[keep]
+
+
+class TrainingLog:
+    """日誌只依日期分組一次，之後每頁只取出該頁日期的列。"""
+
+    def __init__(self, df_log, per_page=10):
+        self.df = df_log
+        self.per_page = per_page
+        self._groups = df_log.groupby("Date").indices if not df_log.empty else {}
+        self.dates = sorted(self._groups, reverse=True)
+
+    @property
+    def n_pages(self):
+        return max((len(self.dates) + self.per_page - 1) // self.per_page, 1)
+
+    def page(self, n):
+        """第 n 頁（從 1 起算）的 [(日期, 該日紀錄), ...]。"""
+        dates = self.dates[(n - 1) * self.per_page:n * self.per_page]
+        cols = [c for c in LOG_COLUMNS if c in self.df]
+        return [(d, self.df.iloc[self._groups[d]][cols]) for d in dates]
@@ -0,0 +1,62 @@
+"""產生 Coach_System_DB 各表的合成資料（get_all_values 格式：第一列為標題）。"""
+import numpy as np
+import pandas as pd
+
+from plan_engine import build_students_dict
+from sheets_db import records_frame
+
+LIFTS = ["Back Squat", "Bench Press", "Deadlift", "Overhead Press", "Power Clean", "Front Squat"]
+ACCESSORIES = ["Pull Up", "Lunge", "Row", "Hip Thrust", "Plank"]
+PLANS = ["Strength Block", "Power Block", "Off Season"]
+
+
+def make_tables(history_rows, n_students=None, weeks=4, days_per_week=3, seed=0):
+    rng = np.random.default_rng(seed)
+    n_students = n_students or max(20, min(history_rows // 500, 500))
+    exercises = LIFTS + ACCESSORIES
+
+    students = [["Name", "StudentID"] + [f"{ex}_1RM" for ex in LIFTS] + ["CMJ_Baseline", "Memo"]]
+    for i in range(n_students):
+        rms = (rng.uniform(40, 200, len(LIFTS))).round().astype(int).tolist()
+        students.append([f"Athlete{i:04d}", f"{i:04d}"] + rms + [round(float(rng.uniform(30, 60)), 1), ""])
+    # 學生 key 用 App 自己的方式產生（StudentID 會被數字化，"0007" -> 7），History 才對得上
+    keys = list(build_students_dict(records_frame(students)))
+
+    plan = [["Plan_Name", "Day", "Order", "Exercise", "Sets", "Reps", "Intensity", "Note"]]
+    for p in PLANS:
+        for w in range(1, weeks + 1):
+            for d in range(1, days_per_week + 1):
+                for order, ex in enumerate(rng.choice(exercises, 6, replace=False), 1):
+                    plan.append([p, f"W{w}D{d}", order, ex, int(rng.integers(2, 6)), int(rng.integers(3, 11)),
+                                 round(float(rng.uniform(0.6, 0.9)), 2) if ex in LIFTS else "-", ""])
+
+    ex_db = [["Lower", "Upper", "Accessory", "⭐重點分析"]]
+    cols = [["Back Squat", "Front Squat", "Deadlift"], ["Bench Press", "Overhead Press", "Power Clean"], ACCESSORIES, LIFTS[:4]]
+    for i in range(max(len(c) for c in cols)):
+        ex_db.append([c[i] if i < len(c) else "" for c in cols])
+
+    warmup = [["Module_Name", "Exercise", "Sets", "Reps", "Note"],
+              ["General", "Jog", 1, "5min", ""], ["General", "Leg Swing", 2, "10", ""], ["Upper", "Band Pull Apart", 2, "15", ""]]
+
+    n = history_rows
+    dates = pd.Timestamp("2022-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 1000, n)), unit="D")
+    is_cmj = rng.random(n) < 0.05
+    ex = np.where(is_cmj, "Countermovement Jump", rng.choice(exercises, n))
+    df = pd.DataFrame({
+        "Date": dates.strftime("%Y-%m-%d"),
+        "StudentID": np.asarray(keys, dtype=object)[rng.integers(0, n_students, n)],
+        "Plan": np.where(is_cmj, "CMJ_Check", rng.choice(PLANS, n)),
+        "Day": np.where(is_cmj, "Day_0", "W1D1"),
+        "Exercise": ex,
+        "Weight": np.where(is_cmj, 0, rng.integers(20, 200, n)),
+        "Reps": np.where(is_cmj, rng.uniform(30, 60, n).round(1), rng.integers(1, 12, n)),
+        "Note": "",
+    })
+    history = [df.columns.tolist()] + df.astype(str).to_numpy().tolist()
+
+    return {
+        "Students": students, "Plan": plan, "ExerciseDB": ex_db, "Warmup_Modules": warmup,
+        "History": history,
+        "Warmup_History": [["Date", "StudentID", "Module", "Exercise", "Sets", "Reps", "Note"]],
+        "Body_Composition": [["Date", "StudentID", "Weight", "Fat", "Muscle", "Note"]],
+    }
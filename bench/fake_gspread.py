@@ -0,0 +1,97 @@
+"""替代 gspread / Credentials 的本地假物件，計算每種 API 呼叫次數，可模擬網路延遲。"""
+import threading
+import time
+from collections import Counter
+
+import gspread
+import google.oauth2.service_account as service_account
+
+from storage import MemoryWorksheet
+
+
+class CallCounter:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def hit(self, name):
+        with self._lock: self.calls[name] += 1
+        if self.latency: time.sleep(self.latency)
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+    def snapshot(self):
+        with self._lock: return dict(self.calls)
+
+    def reset(self):
+        with self._lock: self.calls.clear()
+
+
+class FakeWorksheet(MemoryWorksheet):
+    def __init__(self, title, values, counter, sheet_id):
+        super().__init__(title, values)
+        self.counter = counter
+        self.id = sheet_id
+
+    def get_all_values(self):
+        self.counter.hit("get_all_values")
+        return super().get_all_values()
+
+    def get_all_records(self):
+        self.counter.hit("get_all_records")
+        return super().get_all_records()
+
+    def get_values(self, range_name=None):
+        self.counter.hit("get_values")
+        return super().get_values(range_name)
+
+    def append_rows(self, rows, **kwargs):
+        self.counter.hit("append_rows")
+        return super().append_rows(rows, **kwargs)
+
+    def col_values(self, col):
+        self.counter.hit("col_values")
+        return super().col_values(col)
+
+    def row_values(self, row):
+        self.counter.hit("row_values")
+        return super().row_values(row)
+
+    def update_cell(self, row, col, value):
+        self.counter.hit("update_cell")
+        return super().update_cell(row, col, value)
+
+
+class FakeSpreadsheet:
+    def __init__(self, tables, counter):
+        self.counter = counter
+        self.tables = {name: FakeWorksheet(name, values, counter, i) for i, (name, values) in enumerate(tables.items())}
+
+    def worksheet(self, name):
+        self.counter.hit("worksheet")
+        if name not in self.tables: raise gspread.exceptions.WorksheetNotFound(name)
+        return self.tables[name]
+
+    def batch_update(self, body):
+        self.counter.hit("batch_update")
+
+
+class FakeClient:
+    def __init__(self, tables, latency=0.0):
+        self.counter = CallCounter(latency)
+        self.spreadsheet = FakeSpreadsheet(tables, self.counter)
+
+    def open(self, name):
+        self.counter.hit("open")
+        return self.spreadsheet
+
+
+def install(tables, latency=0.0):
+    """把 gspread.authorize 與 Credentials 換成假物件；回傳 FakeClient 以讀取呼叫次數。"""
+    client = FakeClient(tables, latency)
+    gspread.authorize = lambda creds: client
+    service_account.Credentials.from_service_account_info = classmethod(lambda cls, info, **kwargs: object())
+    return client
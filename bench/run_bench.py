@@ -0,0 +1,208 @@
+"""coach_app.py 的效能 / 負載測試。
+
+以 bench/fake_gspread.py 取代 Google Sheets，產生指定筆數的合成 History，再用
+Streamlit AppTest 實際執行 App，量測：冷啟動、Workout / History rerun 延遲、存檔延遲、
+不同同時在線人數下的延遲，以及每個操作的 API 呼叫次數。結果寫成 JSON 方便追蹤退步。
+
+    python bench/run_bench.py                          # 10k / 100k / 1M，兩種後端
+    python bench/run_bench.py --sizes 10000 --backends sheets --latency 0.05
+    python bench/run_bench.py --concurrency 1 4 16     # 同時 1 / 4 / 16 個 session
+    python bench/run_bench.py --baseline old.json      # 與舊結果比較
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from datasets import make_tables
+from fake_gspread import install
+
+APP = os.path.join(ROOT, "coach_app.py")
+WORKOUT, HISTORY = "今日訓練 (Workout)", "歷史查詢 (History)"
+
+
+def _timed(fn):
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
+
+def _run(at):
+    at.run()
+    if at.exception: raise RuntimeError(at.exception[0].message)
+
+
+def _stats(samples):
+    samples = sorted(samples)
+    return {"median_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2), "n": len(samples)}
+
+
+class Phase:
+    """量測一段操作的耗時與 API 呼叫次數。"""
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def __enter__(self):
+        self.counter.reset()
+        return self
+
+    def __exit__(self, *exc):
+        self.calls = self.counter.snapshot()
+        self.total = sum(self.calls.values())
+
+
+def run_concurrent(new_session, n, reruns):
+    """n 個新 session 同時開啟，各自再 rerun reruns 次；回傳 (首次載入耗時, rerun 耗時, 總耗時)。"""
+    start = threading.Barrier(n)
+
+    def user():
+        at = new_session()
+        start.wait()  # 全部建立好再一起送出第一次請求
+        first = _timed(lambda: _run(at))
+        return first, [_timed(lambda: _run(at)) for _ in range(reruns)]
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        done = [f.result() for f in [pool.submit(user) for _ in range(n)]]
+    return [d[0] for d in done], [s for d in done for s in d[1]], time.perf_counter() - t
+
+
+def run_case(rows, backend, reruns, concurrency, latency, tmp):
+    client = install(make_tables(rows), latency)
+    counter = client.counter
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    secrets = {"gcp_service_account": {"type": "service_account"}, "storage_backend": backend, "sync_interval": 3600,
+               "mirror_path": os.path.join(tmp, f"mirror_{backend}_{rows}.sqlite"),
+               "write_journal": os.path.join(tmp, f"journal_{backend}_{rows}.jsonl")}
+
+    def session():
+        at = AppTest.from_file(APP, default_timeout=3600)
+        for k, v in secrets.items(): at.secrets[k] = v
+        return at
+
+    res = {"rows": rows, "backend": backend, "latency_s": latency, "api_calls": {}}
+    at = session()
+    with Phase(counter) as p: res["cold_start_s"] = round(_timed(lambda: _run(at)), 3)
+    res["api_calls"]["cold_start"] = p.calls
+
+    with Phase(counter) as p: samples = [_timed(lambda: _run(at)) for _ in range(reruns)]
+    res["workout_rerun"] = _stats(samples)
+    res["api_calls"]["workout_rerun_per_run"] = round(p.total / reruns, 2)
+
+    at.sidebar.radio[0].set_value(HISTORY)
+    with Phase(counter) as p: res["history_first_s"] = round(_timed(lambda: _run(at)), 3)
+    res["api_calls"]["history_first"] = p.calls
+    with Phase(counter) as p: samples = [_timed(lambda: _run(at)) for _ in range(reruns)]
+    res["history_rerun"] = _stats(samples)
+    res["api_calls"]["history_rerun_per_run"] = round(p.total / reruns, 2)
+
+    # 存檔：把建議重量填入實際重量後按下「紀錄主訓練」
+    at.sidebar.radio[0].set_value(WORKOUT)
+    _run(at)
+    df = at.session_state["workout_df"].copy()
+    df["實際重量"] = pd.to_numeric(df["建議重量"], errors="coerce").fillna(20).astype(float)
+    at.session_state["workout_df"] = df
+    _run(at)
+    history_ws = client.spreadsheet.tables["History"]
+    before = len(history_ws.values)
+    save = next(b for b in at.button if b.label == "💾 紀錄主訓練")
+    with Phase(counter) as p: res["save_s"] = round(_timed(lambda: (save.click(), _run(at))), 3)
+    res["api_calls"]["save_sync"] = p.calls
+    # 背景寫入：直連 Sheets 時等到資料真的出現在工作表；SQLite 鏡像則只寫本機
+    t0, res["flush_s"] = time.perf_counter(), None
+    if backend == "sheets":
+        while time.perf_counter() - t0 < 30:
+            if len(history_ws.values) > before:
+                res["flush_s"] = round(time.perf_counter() - t0, 3)
+                break
+            time.sleep(0.01)
+
+    # 負載：每個等級 n 個新 session 同時開啟並 rerun，量測延遲隨同時在線人數的變化
+    res["concurrency"] = []
+    for n in concurrency:
+        with Phase(counter) as p: first, again, wall = run_concurrent(session, n, reruns)
+        res["concurrency"].append({"sessions": n, "wall_s": round(wall, 3), "first_run": _stats(first),
+                                   "rerun": _stats(again) if again else None, "api_calls": p.total,
+                                   "api_calls_per_session": round(p.total / n, 2)})
+    return res
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding="utf-8") as f: base = {(r["rows"], r["backend"]): r for r in json.load(f)["results"]}
+    metrics = [("cold_start_s", None), ("history_first_s", None), ("save_s", None),
+               ("workout_rerun", "median_ms"), ("history_rerun", "median_ms")]
+    regressions = []
+    for r in results:
+        b = base.get((r["rows"], r["backend"]))
+        if not b: continue
+        # 同時在線人數各等級的首次載入 p95 也列入比較
+        levels = {c["sessions"]: c for c in b.get("concurrency", [])}
+        for c in r.get("concurrency", []):
+            old, new = (levels.get(c["sessions"]) or {}).get("first_run", {}).get("p95_ms"), c["first_run"]["p95_ms"]
+            if old and new > old * (1 + threshold):
+                regressions.append(f"{r['rows']:>8} {r['backend']:<6} {c['sessions']} sessions first_run.p95_ms: {old} -> {new}")
+        for m, sub in metrics:
+            new, old = (r.get(m) or {}).get(sub) if sub else r.get(m), (b.get(m) or {}).get(sub) if sub else b.get(m)
+            if new and old and new > old * (1 + threshold):
+                regressions.append(f"{r['rows']:>8} {r['backend']:<6} {m}{'.' + sub if sub else ''}: {old} -> {new}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="coach_app.py benchmark / load test")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", default=["sheets", "sqlite"], choices=["sheets", "sqlite"])
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="同時開啟的 session 數（每個數字一輪）")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次假 API 呼叫的延遲秒數")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="先前的結果 JSON，列出變慢超過 --threshold 的項目")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError: commit = ""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.sizes:
+            for backend in args.backends:
+                print(f"▶ {rows:,} rows / {backend}", flush=True)
+                r = run_case(rows, backend, args.reruns, args.concurrency, args.latency, tmp)
+                print(f"  cold {r['cold_start_s']}s · workout {r['workout_rerun']['median_ms']}ms · "
+                      f"history {r['history_rerun']['median_ms']}ms · save {r['save_s']}s", flush=True)
+                for c in r["concurrency"]:
+                    print(f"  {c['sessions']:>3} sessions: first p95 {c['first_run']['p95_ms']}ms · "
+                          f"rerun p95 {(c['rerun'] or {}).get('p95_ms')}ms · {c['api_calls_per_session']} calls/session", flush=True)
+                results.append(r)
+
+    out = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+                    "pandas": pd.__version__, "streamlit": st.__version__}, "results": results}
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(out, f, ensure_ascii=False, indent=2)
+    print(f"已寫入 {args.out}")
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        for line in regressions: print("⚠️ " + line)
+        if regressions: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,48 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
-import time
-import altair as alt
 import os
-import re
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from write_queue import WriteQueue
+from sheets_db import STATIC_TABLES, HISTORY_TABLES, HistoryStore, TableNotFound, TableVersions, clean_columns, records_frame, row_checksum
+from analytics import FORMULAS, HistoryAnalytics, TrainingLog, filter_log
+from dedup import SignatureIndex
+from prescription import E1RMIndex
+from readiness import ACWR_HIGH, ACWR_LOW, CMJ_DROP, E1RM_DROP, ReadinessEngine
+from plan_engine import build_students_dict, expand_mesocycle, expand_team, history_rows, sort_key
+from metrics import InstrumentedBackend, Metrics
+from transfer import SCHEMAS, export_table, import_file
+from storage import MIRROR_PATH, SCOPES, SheetsBackend, SQLiteMirror
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+WRITE_JOURNAL = os.path.join(APP_DIR, "write_journal.jsonl")
+WORKOUT, TEAM, SQUAD = "今日訓練 (Workout)", "團隊訓練 (Team)", "團隊狀態 (Readiness)"
+HISTORY, DATA = "歷史查詢 (History)", "匯入匯出 (Data)"
+# 每個模式只讀自己用到的靜態表（History 類表在用到時才讀）
+MODE_TABLES = {
+    WORKOUT: ("Students", "Plan", "ExerciseDB", "Warmup_Modules"),
+    TEAM: ("Students", "Plan"),
+    SQUAD: ("Students", "ExerciseDB"),
+    HISTORY: ("Students", "ExerciseDB"),
+    DATA: ("Students",),
+}
 
 # --- 1. 設定頁面 ---
 st.set_page_config(page_title="RC Sports Performance", layout="wide")
+rerun_started = time.perf_counter()
 
 # ==========================================
 # 🛠️ 狀態初始化
 # ==========================================
 if 'workout_df' not in st.session_state:
     st.session_state['workout_df'] = pd.DataFrame()
-if 'saved_signatures' not in st.session_state:
-    st.session_state['saved_signatures'] = set()
 if 'warmup_df' not in st.session_state:
     st.session_state['warmup_df'] = pd.DataFrame()
 if 'selected_student' not in st.session_state:
@@ -39,113 +64,218 @@ st.sidebar.divider()
 
 @st.cache_resource
 def get_google_sheet_client():
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
     try:
+        # gspread / google-auth 只在真的要連線時才載入
+        import gspread
+        from google.oauth2.service_account import Credentials
         creds_dict = st.secrets["gcp_service_account"]
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
         client = gspread.authorize(creds)
         return client
     except Exception:
         return None
 
-@st.cache_data(ttl=3600)
-def load_static_data():
+def get_setting(name, default):
+    try: return st.secrets.get(name, default)
+    except Exception: return default
+
+@st.cache_resource
+def get_metrics():
+    # 全程序共用的計數 / 計時器
+    return Metrics()
+
+@st.cache_resource
+def get_table_versions():
+    # 每張工作表一個版本戳，寫入後只遞增被動到的表
+    return TableVersions()
+
+@st.cache_resource
+def get_backend():
+    # 預設讀寫本地 SQLite 鏡像，背景與 Google Sheets 雙向同步；storage_backend = "sheets" 則直連
+    # 兩層都包上計數器：sheets 為真正的 API 呼叫，sqlite 為本機讀寫
     client = get_google_sheet_client()
-    if not client: return {}, pd.DataFrame(), {}, pd.DataFrame(), []
+    remote = InstrumentedBackend(SheetsBackend(client), get_metrics(), "sheets") if client else None
+    if get_setting("storage_backend", "sqlite") == "sheets": return remote
+    mirror = SQLiteMirror(get_setting("mirror_path", MIRROR_PATH), remote, on_change=get_table_versions().bump)
+    mirror.start(interval=int(get_setting("sync_interval", 60)))
+    return InstrumentedBackend(mirror, get_metrics(), "sqlite")
+
+# 各表獨立快取，以版本戳當 key：某張表遞增版本後只有它會重讀
+# 用 cache_resource 讓所有 session 共用同一份（唯讀，不要就地修改）
+@st.cache_resource(ttl=3600, max_entries=2)
+def load_students(version):
+    values = get_backend().worksheet("Students").get_all_values()
+    df_students = records_frame(values)
+    if not df_students.empty: df_students["_checksum"] = [row_checksum(r) for r in values[1:]]
+    return build_students_dict(df_students)
+
+@st.cache_resource(ttl=3600, max_entries=2)
+def load_plan(version):
+    return clean_columns(pd.DataFrame(get_backend().worksheet("Plan").get_all_records()))
+
+@st.cache_resource(ttl=3600, max_entries=2)
+def load_exercise_db(version):
+    exercise_db, key_lifts = {}, []
     try:
-        sheet = client.open("Coach_System_DB")
-        ws_students = sheet.worksheet("Students")
-        ws_plan = sheet.worksheet("Plan")
-        
-        # ExerciseDB
-        key_lifts = []
-        try:
-            ws_ex_db = sheet.worksheet("ExerciseDB")
-            ex_rows = ws_ex_db.get_all_values()
-            exercise_db = {}
-            if ex_rows:
-                categories = ex_rows[0]
-                for col_idx, cat in enumerate(categories):
-                    cat_name = cat.strip()
-                    if cat_name:
-                        exercises = []
-                        for row_idx in range(1, len(ex_rows)):
-                            try:
-                                val = ex_rows[row_idx][col_idx]
-                                if val.strip(): exercises.append(val.strip())
-                            except IndexError: break
-                        if cat_name == "⭐重點分析": key_lifts = exercises
-                        else: exercise_db[cat_name] = exercises
-        except: exercise_db = {}
-
-        # Warmup Modules
-        try:
-            ws_warmup_mod = sheet.worksheet("Warmup_Modules")
-            raw_data = ws_warmup_mod.get_all_values()
-            if len(raw_data) > 1:
-                headers = [str(h).strip() for h in raw_data[0]]
-                df_warmup_modules = pd.DataFrame(raw_data[1:], columns=headers)
-            else: df_warmup_modules = pd.DataFrame()
-        except: df_warmup_modules = pd.DataFrame()
-
-        df_students = pd.DataFrame(ws_students.get_all_records())
-        df_plan = pd.DataFrame(ws_plan.get_all_records())
-
-        if not df_students.empty: df_students.columns = df_students.columns.astype(str).str.strip()
-        if not df_plan.empty: df_plan.columns = df_plan.columns.astype(str).str.strip()
-
-        students_dict = {}
-        if not df_students.empty:
-            for _, row in df_students.iterrows():
-                name = row.get('Name', 'Unknown')
-                sid = row.get('StudentID', '000')
-                key = f"{name} ({sid})"
-                rm_data = {k.replace("_1RM", ""): v for k, v in row.items() if "_1RM" in k and pd.notna(v) and v != ""}
-                raw_cmj = row.get("CMJ_Baseline", 0)
-                try: cmj_static = float(raw_cmj)
-                except: cmj_static = 0.0
-                students_dict[key] = {"rm": rm_data, "cmj_static": cmj_static, "memo": row.get("Memo", "")}
-
-        return students_dict, df_plan, exercise_db, df_warmup_modules, key_lifts
-    except: return {}, pd.DataFrame(), {}, pd.DataFrame(), []
-
-def get_history_worksheets():
-    client = get_google_sheet_client()
-    if not client: return None, None, None, pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        ex_rows = get_backend().worksheet("ExerciseDB").get_all_values()
+        if ex_rows:
+            categories = ex_rows[0]
+            for col_idx, cat in enumerate(categories):
+                cat_name = cat.strip()
+                if cat_name:
+                    exercises = []
+                    for row_idx in range(1, len(ex_rows)):
+                        try:
+                            val = ex_rows[row_idx][col_idx]
+                            if val.strip(): exercises.append(val.strip())
+                        except IndexError: break
+                    if cat_name == "⭐重點分析": key_lifts = exercises
+                    else: exercise_db[cat_name] = exercises
+    except: exercise_db = {}
+    return exercise_db, key_lifts
+
+@st.cache_resource(ttl=3600, max_entries=2)
+def load_warmup_modules(version):
     try:
-        sheet = client.open("Coach_System_DB")
-        ws_history = sheet.worksheet("History")
-        ws_warmup_hist = sheet.worksheet("Warmup_History")
-        try:
-            ws_body_comp = sheet.worksheet("Body_Composition")
-            df_body_comp = pd.DataFrame(ws_body_comp.get_all_records())
-            if not df_body_comp.empty: df_body_comp.columns = df_body_comp.columns.astype(str).str.strip()
-        except: 
-            ws_body_comp = None
-            df_body_comp = pd.DataFrame()
-        
-        df_history = pd.DataFrame(ws_history.get_all_records())
-        if not df_history.empty: df_history.columns = df_history.columns.astype(str).str.strip()
-        df_warmup_history = pd.DataFrame(ws_warmup_hist.get_all_records())
-        if not df_warmup_history.empty: df_warmup_history.columns = df_warmup_history.columns.astype(str).str.strip()
-            
-        return ws_history, ws_warmup_hist, ws_body_comp, df_history, df_warmup_history, df_body_comp
-    except: return None, None, None, pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        raw_data = get_backend().worksheet("Warmup_Modules").get_all_values()
+        if len(raw_data) > 1:
+            headers = [str(h).strip() for h in raw_data[0]]
+            return pd.DataFrame(raw_data[1:], columns=headers)
+    except: pass
+    return pd.DataFrame()
+
+@st.cache_data(ttl=3600, max_entries=64)
+def load_mesocycle(plan_version, students_version, plan_name, student_key, rm_version=None, today=None):
+    # 整個計畫所有天數一次展開，切換進度不需重新計算
+    # rm_version 不為 None 時，有近期紀錄的動作改用 History 的 e1RM（版本變了才重算）
+    df_plan = load_plan(plan_version)
+    student_rm = load_students(students_version).get(student_key, {}).get("rm", {})
+    if rm_version is not None and not df_plan.empty:
+        exercises = df_plan.loc[df_plan["Plan_Name"] == plan_name, "Exercise"].unique()
+        student_rm = get_e1rm_index().merged_rm(student_key, student_rm, exercises, today)
+    return expand_mesocycle(df_plan, plan_name, student_rm)
+
+@st.cache_data(ttl=3600, max_entries=16)
+def load_team_session(plan_version, students_version, plan_name, day, roster, rm_versions=None, today=None):
+    # 整批學生同一份 Plan/Day 一次展開
+    df_plan = load_plan(plan_version)
+    students = load_students(students_version)
+    if rm_versions is not None and not df_plan.empty:
+        exercises = df_plan.loc[(df_plan["Plan_Name"] == plan_name) & (df_plan["Day"] == day), "Exercise"].unique()
+        students = {k: {"rm": get_e1rm_index().merged_rm(k, students.get(k, {}).get("rm", {}), exercises, today)} for k in roster}
+    return expand_team(df_plan, plan_name, day, students, list(roster))
+
+@st.cache_resource
+def get_loader_pool():
+    # 讀表用的共用執行緒池，多張表同時讀取
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="sheet-loader")
+
+@st.cache_resource
+def get_prefetch_pool():
+    # 背景預讀 History 用自己的執行緒，不佔用靜態表的讀取
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-prefetch")
+
+STATIC_LOADERS = {"Students": load_students, "Plan": load_plan, "ExerciseDB": load_exercise_db, "Warmup_Modules": load_warmup_modules}
+STATIC_DEFAULTS = {"Students": {}, "Plan": pd.DataFrame(), "ExerciseDB": ({}, []), "Warmup_Modules": pd.DataFrame()}
+
+def load_static_data(names):
+    """平行讀取 names 中的靜態表，回傳 {表名: 結果}；讀取失敗的表給空值。"""
+    if not get_backend(): return dict(STATIC_DEFAULTS)
+    v, ctx = get_table_versions(), get_script_run_ctx()
+
+    def load(name):
+        # 帶上目前的 script context，st.cache_resource 才能在執行緒中使用
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return STATIC_LOADERS[name](v.get(name))
+
+    futures = {name: get_loader_pool().submit(load, name) for name in names}
+    out = dict(STATIC_DEFAULTS)
+    for name, f in futures.items():
+        try: out[name] = f.result()
+        except Exception: pass
+    return out
+
+def refresh_tables(names):
+    # 靜態表遞增版本即可讓快取失效；History 類則整張重讀到共用快取
+    store = get_history_store()
+    if hasattr(get_backend(), "sync"): get_backend().sync(names)
+    for name in names:
+        # 重整後資料已是最新，之前的衝突提示不再需要
+        if get_write_queue(): get_write_queue().conflicts.clear(name)
+        if hasattr(get_backend(), "conflicts"): get_backend().conflicts.clear(name)
+        if name in STATIC_TABLES: get_table_versions().bump(name)
+        elif store: store.reload(name)
+
+def get_history_store():
+    # 沒有後端時不快取 None，連線恢復後下次呼叫就會建立
+    return _shared_history_store() if get_backend() else None
+
+@st.cache_resource
+def _shared_history_store():
+    # 跨 rerun 共用的 History 快取；各表第一次用到時才完整讀取
+    return HistoryStore(get_backend(), min_interval=3 if hasattr(get_backend(), "sync") else 15)
+
+@st.cache_resource
+def get_write_queue():
+    # 所有存檔走背景佇列；寫完後只遞增該表版本
+    store = get_history_store()
+    if store is None: return None
+    return WriteQueue(get_backend(), store, get_setting("write_journal", WRITE_JOURNAL), on_flush=get_table_versions().bump)
+
+@st.cache_resource
+def get_signature_index():
+    # 所有 session 共用，由 History 增量維護
+    return SignatureIndex()
+
+@st.cache_resource
+def get_history_analytics():
+    # 所有 session 共用一份彙總結果
+    return HistoryAnalytics()
+
+@st.cache_resource
+def get_e1rm_index():
+    # 所有 session 共用，由 History 增量維護（只含已寫入工作表的列）
+    return E1RMIndex()
 
-# 連線檢查
-client = get_google_sheet_client()
-if not client:
+@st.cache_resource
+def get_readiness_engine():
+    # 所有 session 共用，由 History 增量維護
+    return ReadinessEngine()
+
+def get_history_table(name="History"):
+    """回傳 (TableCache, DataFrame)；第一次呼叫時才讀取該表，之後只做增量更新。"""
+    store = get_history_store()
+    table = store.table(name) if store else None
+    if table is None: return None, pd.DataFrame()
+    try: table.refresh()
+    except Exception: pass
+    return table, table.frame
+
+def queue_rows(table, rows, on_failed=None):
+    """排入寫入佇列；佇列已滿時顯示錯誤並回傳 None，存檔按鈕不會讓整頁出錯。"""
+    try: return write_queue.append_rows(table, rows, on_failed)
+    except queue.Full:
+        st.error("⚠️ 寫入佇列已滿，請稍後再存一次")
+        return None
+
+# 連線檢查：本地鏡像有資料時可離線使用
+backend = get_backend()
+if not backend or not (get_google_sheet_client() or getattr(backend, "has_data", False)):
     st.error("⚠️ 無法連接至 Google 雲端資料庫，請重整頁面。")
     st.stop()
 
-students_dict, df_plan, exercise_db, df_warmup_modules, key_lifts = load_static_data()
-ws_history, ws_warmup_hist, ws_body_comp, df_history, df_warmup_history, df_body_comp = get_history_worksheets()
+metrics = get_metrics()
+app_mode = st.session_state.get("app_mode", WORKOUT)
+with metrics.timer("load_static"):
+    static = load_static_data(MODE_TABLES.get(app_mode, MODE_TABLES[WORKOUT]))
+students_dict, df_plan, df_warmup_modules = static["Students"], static["Plan"], static["Warmup_Modules"]
+exercise_db, key_lifts = static["ExerciseDB"]
+write_queue = get_write_queue()
 
 if students_dict:
     # 🌟 Callback Functions (狀態鎖定的核心)
     def on_student_change():
         st.session_state['workout_df'] = pd.DataFrame() # 換人才清空
-        st.session_state['saved_signatures'] = set()
         st.session_state['cmj_input'] = None
 
     def on_plan_change():
@@ -192,38 +322,59 @@ if students_dict:
     if calc_w > 0:
         est_1rm = calc_w * (1 + 0.0333 * calc_r)
         st.sidebar.markdown(f"**預估 1RM:** `{int(est_1rm)}` / **85%:** `{int(est_1rm * 0.85)}`")
+    auto_rm = st.sidebar.toggle("建議重量依近期紀錄", value=False, key="auto_rm",
+                                help="近 90 天 History 中接近最大努力的組（≤5 下，有記 RPE 時 ≥8）估出的 e1RM 高於 Students 的 1RM 時改用 e1RM")
 
     st.sidebar.divider()
-    if st.sidebar.button("🔄 重整資料庫"):
-        st.cache_data.clear()
-        st.rerun()
-
-    app_mode = st.sidebar.radio("功能選單", ["今日訓練 (Workout)", "歷史查詢 (History)"])
-
-    if app_mode == "今日訓練 (Workout)":
+    with st.sidebar.expander("🔄 重整資料庫"):
+        sel_tables = st.multiselect("重整項目", STATIC_TABLES + HISTORY_TABLES, default=list(STATIC_TABLES + HISTORY_TABLES), label_visibility="collapsed")
+        if st.button("🔄 重整", use_container_width=True):
+            refresh_tables(sel_tables)
+            st.rerun()
+
+    if hasattr(backend, "status") and not backend.status()["online"]:
+        st.sidebar.warning("📴 離線模式：資料先存於本機，恢復連線後自動同步")
+    if write_queue:
+        q_stat = write_queue.status()
+        # 樂觀鎖衝突：別的教練先改了同一位學生；只提示目前這位學生，顯示一次即移除
+        sid = student_key.split('(')[1].strip(')') if student_key else None
+        conflicts = write_queue.conflicts.take(sid)
+        if hasattr(backend, "conflicts"): conflicts += backend.conflicts.take(sid)
+        for cf in conflicts:
+            st.sidebar.warning(f"⚠️ 修改未套用：{cf['message']}，請重整 Students 後再修改")
+        if q_stat["failed"]: st.sidebar.error(f"⚠️ {q_stat['failed']} 筆寫入失敗：{q_stat['last_error']}")
+        elif q_stat["pending"]: st.sidebar.caption(f"☁️ 同步中：{q_stat['pending']} 筆待寫入")
+        else: st.sidebar.caption(f"✅ 已同步（{q_stat['flushed']} 筆）")
+    if hasattr(backend, "status") and backend.status()["dirty"]:
+        st.sidebar.caption(f"☁️ 本機尚有 {backend.status()['dirty']} 筆待同步至雲端")
+
+    app_mode = st.sidebar.radio("功能選單", list(MODE_TABLES), key="app_mode")
+
+    if app_mode == WORKOUT:
         left_col, right_col = st.columns([3, 7], gap="large")
 
         # --- 左側欄 ---
         with left_col:
             st.markdown(f"## {student_key.split('(')[0]}")
             st.caption(f"ID: {student_key.split('(')[1][:-1]}")
+
+            # 準備度：History 已在共用快取中才計算，不為此擋住首屏
+            hist_cache = get_history_store().table("History", load=False) if get_history_store() else None
+            if hist_cache is not None:
+                readiness = get_readiness_engine()
+                readiness.sync(hist_cache)
+                ready = readiness.athlete(student_key, selected_date, cmj_static_base, key_lifts)
+                for flag in ready["flags"]: st.warning(f"⚠️ {flag}")
+                if ready["acwr"] is not None and not ready["flags"]: st.caption(f"🟢 ACWR {ready['acwr']:.2f}")
             
             with st.expander("📝 教練備忘 (Memo)", expanded=True):
                 new_memo = st.text_area("Memo", value=student_memo, height=100, label_visibility="collapsed")
                 if st.button("💾 更新備註"):
                     try:
-                        fresh_sheet = client.open("Coach_System_DB")
-                        ws_fresh = fresh_sheet.worksheet("Students")
+                        # 背景寫入 Students 第 9 欄，完成後只讓 Students 快取失效
                         sid = student_key.split('(')[1].strip(')')
-                        all_ids = ws_fresh.col_values(2) 
-                        try:
-                            row_idx = all_ids.index(sid) + 1 
-                            ws_fresh.update_cell(row_idx, 9, new_memo) 
-                            st.toast("✅ 備註已更新！")
-                            time.sleep(1)
-                            st.cache_data.clear()
-                            st.rerun()
-                        except: st.error("找不到此 ID")
+                        write_queue.update_by_key("Students", 2, sid, 9, new_memo, expected=student_data.get("checksum"))
+                        st.toast("✅ 備註已更新！")
                     except Exception as e: st.error(f"Error: {e}")
 
             st.markdown("### ⚖️ 身體數值")
@@ -232,10 +383,9 @@ if students_dict:
             in_muscle = st.number_input("骨骼肌 (kg)", step=0.1)
             
             if st.button("💾 存入數值"):
-                if ws_body_comp:
-                    ws_body_comp.append_rows([[record_date_str, student_key, in_weight, in_fat, in_muscle, ""]])
-                    st.toast("✅ 已儲存")
-                    st.cache_data.clear()
+                if write_queue and write_queue.has_table("Body_Composition"):
+                    if queue_rows("Body_Composition", [[record_date_str, student_key, in_weight, in_fat, in_muscle, ""]]):
+                        st.toast("✅ 已儲存")
 
         # --- 右側欄 (主操作區) ---
         with right_col:
@@ -257,9 +407,8 @@ if students_dict:
                 recs = []
                 for _, r in edited_warmup.iterrows():
                     if r["動作名稱"]: recs.append([record_date_str, student_key, sel_warmup, r["動作名稱"], r["組數"], r["次數/時間"], r["備註"]])
-                if recs and ws_warmup_hist:
-                    ws_warmup_hist.append_rows(recs)
-                    st.toast("✅ 暖身已存")
+                if recs and write_queue and write_queue.has_table("Warmup_History"):
+                    if queue_rows("Warmup_History", recs): st.toast("✅ 暖身已存")
 
             st.divider()
 
@@ -268,9 +417,9 @@ if students_dict:
             with c1: cmj_val = st.number_input("CMJ 高度", step=0.5, key="cmj_input")
             with c2:
                 if st.button("紀錄 CMJ", type="primary"):
-                    if cmj_val > 0 and ws_history:
-                        ws_history.append_rows([[record_date_str, student_key, "CMJ_Check", "Day_0", "Countermovement Jump", 0, cmj_val, f"Base:{cmj_static_base}"]])
-                        st.toast("✅ CMJ 已存")
+                    if cmj_val > 0 and write_queue:
+                        if queue_rows("History", [[record_date_str, student_key, "CMJ_Check", "Day_0", "Countermovement Jump", 0, cmj_val, f"Base:{cmj_static_base}"]]):
+                            st.toast("✅ CMJ 已存")
 
             st.divider()
             st.markdown("### 🏋️‍♂️ 主訓練")
@@ -291,11 +440,15 @@ if students_dict:
                 )
 
             with c_p2:
-                raw_days = df_plan[df_plan["Plan_Name"] == plan_name]["Day"].unique().tolist()
-                def sort_key(d_str):
-                    m = re.search(r'W(\d+)D(\d+)', str(d_str), re.IGNORECASE)
-                    return (int(m.group(1)), int(m.group(2))) if m else (999, 999)
-                sorted_days = sorted(raw_days, key=sort_key)
+                e1rm_index = get_e1rm_index()
+                if auto_rm and hist_cache is not None: e1rm_index.sync(hist_cache)
+                rm_version = e1rm_index.version(student_key) if auto_rm else None
+                with metrics.timer("plan_expansion"):
+                    # 讀表失敗不會被快取；這次先給空課表，下次 rerun 再試
+                    try: mesocycle = load_mesocycle(get_table_versions().get("Plan"), get_table_versions().get("Students"), plan_name, student_key,
+                                                    rm_version, selected_date)
+                    except Exception: mesocycle = {}
+                sorted_days = list(mesocycle)
                 
                 if st.session_state['selected_day'] not in sorted_days:
                     st.session_state['selected_day'] = sorted_days[0] if sorted_days else None
@@ -308,25 +461,15 @@ if students_dict:
                 )
 
             # --- 資料讀取 ---
+            # 近期 e1RM 更新了、且還沒填任何實際重量時，重新帶入建議重量
+            df_curr = st.session_state['workout_df']
+            if st.session_state.get('workout_rm_version') != (student_key, rm_version):
+                if isinstance(df_curr, pd.DataFrame) and "實際重量" in df_curr and df_curr["實際重量"].isna().all():
+                    st.session_state['workout_df'] = pd.DataFrame()
+                st.session_state['workout_rm_version'] = (student_key, rm_version)
             # 邏輯：只在 workout_df 為空時 (代表剛切換選項) 讀取資料
             if st.session_state['workout_df'].empty:
-                df_view = df_plan[(df_plan["Plan_Name"] == plan_name) & (df_plan["Day"] == day)].copy()
-                student_rm = students_dict.get(student_key, {}).get("rm", {})
-                final_rows = []
-                for _, row in df_view.iterrows():
-                    rm = student_rm.get(row["Exercise"], 0)
-                    try: w = int(rm * float(row["Intensity"]))
-                    except: w = 0
-                    try: sets_count = int(row['Sets'])
-                    except: sets_count = 1
-                    
-                    for i in range(1, sets_count + 1):
-                        final_rows.append({
-                            "選取": False, "編號": str(row["Order"]), "動作名稱": row["Exercise"], 
-                            "組數": f"Set {i}", "計畫次數": row["Reps"], "強度": str(row["Intensity"]), 
-                            "建議重量": w, "實際重量": None, "實際次數": row["Reps"], "備註": row.get("Note", "")
-                        })
-                st.session_state['workout_df'] = pd.DataFrame(final_rows)
+                st.session_state['workout_df'] = mesocycle.get(day, pd.DataFrame())
 
             # --- 新增/修改區 ---
             with st.expander("🛠️ 臨時新增/修改"):
@@ -362,42 +505,112 @@ if students_dict:
                 }
             )
 
+            force_save = st.checkbox("允許儲存與歷史紀錄相同的組", value=False)
             if st.button("💾 紀錄主訓練", type="primary", use_container_width=True):
-                recs = []
-                count = 0
-                for _, r in edited_df.iterrows():
-                    if (pd.notna(r["實際重量"]) and r["實際重量"] > 0) or (pd.notna(r["實際次數"]) and r["實際次數"] > 0):
-                        sig = f"{student_key}|{record_date_str}|{r['動作名稱']}|{r['組數']}|{r['實際重量']}|{r['實際次數']}"
-                        if sig not in st.session_state['saved_signatures']:
-                            recs.append([record_date_str, student_key, plan_name, day, r["動作名稱"], r["實際重量"], r["實際次數"], r["備註"]])
-                            st.session_state['saved_signatures'].add(sig)
-                            count += 1
+                recs = history_rows(edited_df, record_date_str, plan_name, day, student=student_key)
+                # 以 History 建立的簽章索引擋重複，跨 session / 重新整理都有效
+                sig_index = get_signature_index()
+                ws_history, _ = get_history_table("History")
+                with metrics.timer("dedup"):
+                    sig_index.sync(ws_history)
+                    recs, skipped = sig_index.filter_new(recs, force=force_save)
                 if recs and ws_history:
-                    ws_history.append_rows(recs)
-                    st.toast(f"✅ 成功儲存 {count} 筆")
-                    st.cache_data.clear()
-                    time.sleep(1)
+                    # 寫入失敗時把這些列移出待寫入，教練可以重新存檔
+                    if queue_rows("History", recs, on_failed=lambda: sig_index.release(recs)):
+                        st.toast(f"✅ 成功儲存 {len(recs)} 筆" + (f"（略過 {skipped} 筆重複）" if skipped else ""))
                 else: st.info("無新資料或已重複")
 
-    elif app_mode == "歷史查詢 (History)":
+    elif app_mode == TEAM:
+        st.header("👥 團隊訓練")
+        available_plans = df_plan["Plan_Name"].unique().tolist() if not df_plan.empty else []
+        t_roster, t_plan, t_day = st.columns([4, 2, 2])
+        with t_roster: roster = st.multiselect("名單", student_list, key="team_roster")
+        with t_plan: team_plan = st.selectbox("選擇計畫", available_plans, key="team_plan")
+        with t_day:
+            team_days = sorted(df_plan.loc[df_plan["Plan_Name"] == team_plan, "Day"].unique().tolist(), key=sort_key) if team_plan else []
+            team_day = st.selectbox("選擇進度", team_days, key="team_day")
+
+        # 名單 / 計畫 / 進度沒變就沿用同一份編輯中的表，換學生不會清掉其他人的輸入
+        team_key = (tuple(roster), team_plan, team_day, auto_rm)
+        if st.session_state.get("team_key") != team_key:
+            e1rm_index = get_e1rm_index()
+            hist_cache = get_history_store().table("History", load=False) if get_history_store() else None
+            if auto_rm and hist_cache is not None: e1rm_index.sync(hist_cache)
+            rm_versions = tuple(e1rm_index.version(k) for k in roster) if auto_rm else None
+            try:
+                st.session_state["team_df"] = load_team_session(get_table_versions().get("Plan"), get_table_versions().get("Students"),
+                                                                team_plan, team_day, tuple(roster), rm_versions, selected_date)
+                st.session_state["team_key"] = team_key
+            except Exception:
+                # 讀表失敗不記 team_key，下次 rerun 再試
+                st.session_state["team_df"] = expand_team(pd.DataFrame(), team_plan, team_day, {}, [])
+
+        if not roster: st.info("請先選擇名單")
+        else:
+            team_edited = st.data_editor(
+                st.session_state["team_df"],
+                hide_index=True, use_container_width=True, key="team_editor",
+                disabled=["學生", "編號", "動作名稱", "組數", "計畫次數", "強度", "建議重量"],
+                column_config={
+                    "選取": None,
+                    "實際重量": st.column_config.NumberColumn("實際 kg", step=0.5),
+                    "實際次數": st.column_config.NumberColumn("實際次數", step=1)
+                }
+            )
+            team_force = st.checkbox("允許儲存與歷史紀錄相同的組", value=False, key="team_force")
+            if st.button("💾 紀錄全隊訓練", type="primary", use_container_width=True):
+                recs = history_rows(team_edited, record_date_str, team_plan, team_day)
+                sig_index = get_signature_index()
+                ws_history, _ = get_history_table("History")
+                with metrics.timer("dedup"):
+                    sig_index.sync(ws_history)
+                    recs, skipped = sig_index.filter_new(recs, force=team_force)
+                if recs and ws_history:
+                    # 全隊的組一次排入佇列，背景以單次 append_rows 寫入
+                    if queue_rows("History", recs, on_failed=lambda: sig_index.release(recs)):
+                        n_students = len({r[1] for r in recs})
+                        st.toast(f"✅ 已儲存 {n_students} 位學生共 {len(recs)} 筆" + (f"（略過 {skipped} 筆重複）" if skipped else ""))
+                else: st.info("無新資料或已重複")
+
+    elif app_mode == SQUAD:
+        st.header("🚦 團隊狀態")
+        with st.spinner("載入歷史紀錄…"), metrics.timer("load_history"):
+            ws_history, _ = get_history_table("History")
+        readiness = get_readiness_engine()
+        with metrics.timer("readiness"):
+            readiness.sync(ws_history)
+            df_squad = readiness.squad(students_dict, selected_date, key_lifts)
+        if df_squad.empty: st.caption("無數據")
+        else:
+            st.caption(f"ACWR > {ACWR_HIGH} 或 < {ACWR_LOW}、CMJ 低於基準 {-CMJ_DROP:.0%} 以上、e1RM 下滑 {-E1RM_DROP:.0%} 以上列為需注意")
+            if st.checkbox("只顯示需注意的學生"): df_squad = df_squad[df_squad["注意事項"] != ""]
+            pct_cols = [c for c in df_squad.columns if c == "CMJ 偏差" or c.endswith(" 趨勢")]
+            df_squad[pct_cols] = df_squad[pct_cols].astype(float) * 100
+            st.dataframe(df_squad, hide_index=True, use_container_width=True,
+                         column_config={"ACWR": st.column_config.NumberColumn(format="%.2f"),
+                                        **{c: st.column_config.NumberColumn(format="%+.1f%%") for c in pct_cols}})
+
+    elif app_mode == HISTORY:
         st.header("🔍 歷史紀錄")
+        # 標題先畫出來，再讀 History（首次較慢）
+        with st.spinner("載入歷史紀錄…"), metrics.timer("load_history"):
+            ws_history, df_history = get_history_table("History")
         if df_history.empty:
             st.warning("⚠️ 目前無歷史紀錄或連線失敗")
         else:
-            df_history['Date'] = pd.to_datetime(df_history['Date'], errors='coerce')
             flt_stu = st.selectbox("篩選學生", ["所有學生"] + student_list)
-            
-            if flt_stu != "所有學生":
-                df_show = df_history[df_history["StudentID"] == flt_stu]
-            else:
-                df_show = df_history
+
+            # 圖表改用預先彙總的每日資料，只在有新列時增量更新
+            import altair as alt  # 只有畫圖時才載入
+            analytics = get_history_analytics()
+            with metrics.timer("analytics_sync"): analytics.sync(ws_history)
+            stu_filter = None if flt_stu == "所有學生" else flt_stu
 
             col_h1, col_h2 = st.columns(2)
             with col_h1:
                 st.subheader("🐇 CMJ 分析")
-                df_cmj = df_show[df_show["Exercise"] == "Countermovement Jump"]
-                if not df_cmj.empty:
-                    chart_data = df_cmj.groupby("Date")["Reps"].max().reset_index()
+                chart_data = analytics.cmj_series(stu_filter)
+                if not chart_data.empty:
                     c = alt.Chart(chart_data).mark_bar(color='#00BA38').encode(x='Date', y='Reps')
                     st.altair_chart(c, use_container_width=True)
                 else: st.caption("無數據")
@@ -405,21 +618,120 @@ if students_dict:
             with col_h2:
                 st.subheader("🏋️‍♂️ 肌力分析 (1RM)")
                 if key_lifts:
-                    t_ex = st.selectbox("動作", key_lifts)
-                    df_ex = df_show[df_show["Exercise"] == t_ex]
-                    if not df_ex.empty:
-                        df_ex["1RM"] = pd.to_numeric(df_ex["Weight"]) * (1 + 0.0333 * pd.to_numeric(df_ex["Reps"]))
-                        chart_data = df_ex.groupby("Date")["1RM"].max().reset_index()
+                    c_ex, c_f = st.columns([3, 2])
+                    with c_ex: t_ex = st.selectbox("動作", key_lifts)
+                    with c_f: rm_formula = st.selectbox("公式", list(FORMULAS))
+                    if rm_formula == "RPE": st.caption("只計入備註寫了 RPE 的組（例如「RPE 8」）")
+                    chart_data = analytics.e1rm_series(stu_filter, t_ex, rm_formula)
+                    if not chart_data.empty:
                         c = alt.Chart(chart_data).mark_line(point=True, color='red').encode(x='Date', y='1RM')
                         st.altair_chart(c, use_container_width=True)
                     else: st.caption("無數據")
                 else: st.caption("請至 ExerciseDB 設定 ⭐重點分析")
 
+            st.subheader("📈 訓練量 (7 日滾動噸位)")
+            chart_data = analytics.load_series(stu_filter)
+            if not chart_data.empty:
+                c = alt.Chart(chart_data).mark_area(opacity=0.6).encode(x='Date', y='rolling_tonnage')
+                st.altair_chart(c, use_container_width=True)
+            else: st.caption("無數據")
+
             st.divider()
             st.subheader("📅 訓練日誌")
-            if not df_show.empty:
-                df_show["DateStr"] = df_show["Date"].dt.strftime('%Y-%m-%d')
-                for d_str in sorted(df_show["DateStr"].unique(), reverse=True):
-                    d_recs = df_show[df_show["DateStr"] == d_str]
-                    with st.expander(f"{d_str} ({len(d_recs)} 筆)"):
-                        st.dataframe(d_recs[["StudentID", "Exercise", "Weight", "Reps", "Note"]], hide_index=True)
+            f_plan, f_ex, f_date = st.columns(3)
+            with f_plan: flt_plans = st.multiselect("計畫", sorted(df_history["Plan"].astype(str).unique()) if "Plan" in df_history else [])
+            with f_ex: flt_exs = st.multiselect("動作", sorted(df_history["Exercise"].astype(str).unique()))
+            with f_date: flt_range = st.date_input("日期範圍", value=())
+            d_start = flt_range[0] if len(flt_range) > 0 else None
+            d_end = flt_range[1] if len(flt_range) > 1 else None
+
+            with metrics.timer("training_log"):
+                # 學生 / 日期先在依 (StudentID, Date) 排序的 frame 上二分切出，再篩計畫與動作
+                df_show = filter_log(ws_history.select(stu_filter, d_start, d_end), None, flt_plans, flt_exs)
+                log = TrainingLog(df_show, per_page=10)
+            if log.dates:
+                # 只建立目前這一頁的日期區塊
+                page = st.number_input(f"頁數（共 {log.n_pages} 頁，{len(log.dates)} 天）", 1, log.n_pages, 1)
+                for d, d_recs in log.page(page):
+                    with st.expander(f"{d.strftime('%Y-%m-%d')} ({len(d_recs)} 筆)"):
+                        st.dataframe(d_recs, hide_index=True)
+            else: st.caption("無符合條件的紀錄")
+
+    elif app_mode == DATA:
+        st.header("📦 匯入 / 匯出")
+        tab_imp, tab_exp = st.tabs(["匯入", "匯出"])
+        with tab_imp:
+            imp_table = st.selectbox("匯入到", list(SCHEMAS))
+            st.caption("必要欄位：" + "、".join(SCHEMAS[imp_table]["required"]) + "；欄位名稱需與工作表標題相同")
+            upload = st.file_uploader("CSV / Parquet 檔案", type=["csv", "parquet"])
+            imp_dedup = st.checkbox("略過與歷史紀錄相同的組", value=True) if imp_table == "History" else False
+            if upload and st.button("📥 開始匯入", type="primary"):
+                sig_index = get_signature_index()
+                if imp_dedup: sig_index.sync(get_history_table("History")[0])
+                skipped = []
+
+                def sink(rows):
+                    # 每塊驗證過的列排入寫入佇列，背景合併成批次 append
+                    on_failed = None
+                    if imp_dedup:
+                        rows, n_skip = sig_index.filter_new(rows)
+                        skipped.append(n_skip)
+                        on_failed = lambda rows=rows: sig_index.release(rows)
+                    if rows: write_queue.append_rows(imp_table, rows, on_failed)
+
+                progress = st.empty()
+                try:
+                    res = import_file(upload, imp_table, sink, headers=get_backend().worksheet(imp_table).row_values(1),
+                                      on_chunk=lambda r: progress.caption(f"已處理 {r['imported'] + r['rejected']} 筆…"))
+                    st.success(f"✅ 匯入 {res['imported'] - sum(skipped)} 筆" + (f"，略過重複 {sum(skipped)} 筆" if sum(skipped) else "")
+                               + (f"，{res['rejected']} 筆格式錯誤" if res["rejected"] else ""))
+                    if res["errors"]: st.dataframe(pd.DataFrame({"錯誤": res["errors"]}), hide_index=True)
+                except ValueError as e: st.error(f"⚠️ {e}")
+                except TableNotFound: st.error(f"⚠️ 找不到工作表 {imp_table}")
+                except queue.Full: st.error("⚠️ 寫入佇列已滿，已排入的部分會繼續寫入，其餘請稍後再匯入")
+
+        with tab_exp:
+            e1, e2, e3 = st.columns(3)
+            with e1: exp_table = st.selectbox("匯出表", list(STATIC_TABLES + HISTORY_TABLES))
+            with e2: exp_stu = st.selectbox("學生", ["所有學生"] + student_list, key="exp_student")
+            with e3: exp_range = st.date_input("日期範圍", value=(), key="exp_range")
+            exp_fmt = st.radio("格式", ["csv", "parquet"], horizontal=True)
+            if st.button("📤 產生匯出檔"):
+                # 分段讀取、逐塊寫到暫存檔，讀進下載按鈕後暫存目錄即刪除
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = os.path.join(tmp, f"{exp_table}.{exp_fmt}")
+                    n = export_table(get_backend().worksheet(exp_table), path,
+                                     student=None if exp_stu == "所有學生" else exp_stu,
+                                     start=exp_range[0] if len(exp_range) > 0 else None,
+                                     end=exp_range[1] if len(exp_range) > 1 else None)
+                    with open(path, "rb") as f: data = f.read()
+                st.download_button(f"⬇️ 下載 {exp_table}.{exp_fmt}（{n} 筆）", data, file_name=f"{exp_table}.{exp_fmt}")
+
+# 畫面送出後才在背景把 History 讀進共用快取，之後存檔或切到歷史查詢不必等
+history_store = get_history_store()
+if history_store: history_store.prefetch("History", get_prefetch_pool())
+
+# ==========================================
+# 效能監控（secrets 設定 admin_key，網址加上 ?admin=<admin_key> 才顯示）
+# ==========================================
+session_id = st.session_state.setdefault("metrics_session", uuid.uuid4().hex[:8])
+rerun_s = time.perf_counter() - rerun_started
+metrics.observe_rerun(app_mode.split("(")[-1].strip(")"), rerun_s, session_id)
+# 本 session 的紀錄放在 session_state，session 結束就跟著釋放
+my_reruns = st.session_state.setdefault("metrics_reruns", deque(maxlen=200))
+my_reruns.append(rerun_s)
+admin_key = get_setting("admin_key", "")
+if admin_key and st.query_params.get("admin") == str(admin_key):
+    with st.sidebar.expander("🛠️ 效能監控"):
+        quota = int(get_setting("sheets_quota_per_min", 60))
+        snap = metrics.snapshot()
+        cpm = snap["sheets_calls_per_min"]
+        st.metric("Sheets API 呼叫 / 分鐘", f"{cpm} / {quota}")
+        st.progress(min(cpm / quota, 1.0))
+        if snap["api_calls"]: st.dataframe(pd.DataFrame(snap["api_calls"]), hide_index=True)
+        if snap["sections"]: st.dataframe(pd.DataFrame(snap["sections"]).T, use_container_width=True)
+        if snap["reruns"]: st.dataframe(pd.DataFrame(snap["reruns"]).T, use_container_width=True)
+        mine = sorted(my_reruns)
+        st.caption(f"本 session rerun：{len(mine)} 次，平均 {sum(mine) / len(mine) * 1000:.0f} ms，"
+                   f"p95 {mine[min(int(len(mine) * 0.95), len(mine) - 1)] * 1000:.0f} ms")
+        st.download_button("Prometheus 匯出", metrics.prometheus(), file_name="coach_metrics.prom")
@@ -0,0 +1,187 @@
+"""History 重複紀錄的偵測與清理。
+
+History 沒有「第幾組」欄位，同一天同動作同重量同次數的多組在表上完全相同，
+因此簽章以 (學生, 日期, 動作, 重量, 次數) 計數：存檔時一次送來的列，超過
+History 既有次數的部分才算新資料。
+
+命令列用法（讀取 .streamlit/secrets.toml 的服務帳號）：
+    python dedup.py            # 列出疑似重複的列
+    python dedup.py --apply    # 逐組確認後刪除，並重設本地鏡像的 History
+
+刪列會讓後面的列號往前移。執行中的 App（TableCache / SQLiteMirror）下次增量讀取時
+會發現最後一列對不上而整表重讀；本機鏡像有未同步資料時拒絕 --apply。
+"""
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+HISTORY_HEADERS = ["Date", "StudentID", "Plan", "Day", "Exercise", "Weight", "Reps", "Note"]
+SIG_COLUMNS = ["StudentID", "Date", "Exercise", "Weight", "Reps"]
+
+
+def _norm_text(s):
+    return s.astype(str).str.strip()
+
+
+def _norm_num(s):
+    # "100" / 100 / 100.0 視為相同
+    num = pd.to_numeric(s, errors="coerce")
+    txt = _norm_text(s.where(s.notna(), ""))
+    return txt.where(num.isna(), num.map(lambda v: f"{v:g}"))
+
+
+def _norm_date(s):
+    d = pd.to_datetime(s, errors="coerce")
+    return _norm_text(s).where(d.isna(), d.dt.strftime("%Y-%m-%d"))
+
+
+def signature_hashes(df):
+    """每列簽章的 64-bit 雜湊（跨程序固定，可重建）。"""
+    if df.empty: return np.empty(0, dtype=np.uint64)
+    key = (_norm_text(df["StudentID"]) + "|" + _norm_date(df["Date"]) + "|" + _norm_text(df["Exercise"])
+           + "|" + _norm_num(df["Weight"]) + "|" + _norm_num(df["Reps"]))
+    return pd.util.hash_array(key.to_numpy(dtype=object))
+
+
+def _row_hashes(rows, headers):
+    df = pd.DataFrame([(list(r) + [""] * len(headers))[:len(headers)] for r in rows], columns=headers)
+    return signature_hashes(df).tolist()
+
+
+class SignatureIndex:
+    """History 簽章計數：排序的 uint64 陣列 + 次數，另記尚未寫入工作表的列。"""
+
+    def __init__(self):
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._pending = {}
+        self._epoch, self._pos = None, 0
+        self._lock = threading.Lock()
+
+    def _count(self, h):
+        i = np.searchsorted(self._keys, h)
+        return int(self._counts[i]) if i < len(self._keys) and self._keys[i] == h else 0
+
+    def _add(self, hashes):
+        if not len(hashes): return
+        u, c = np.unique(hashes, return_counts=True)
+        keys = np.concatenate([self._keys, u])
+        counts = np.concatenate([self._counts, c])
+        self._keys, inv = np.unique(keys, return_inverse=True)
+        self._counts = np.bincount(inv, weights=counts).astype(np.int64)
+        # 已寫入的列不再算在待寫入裡
+        for h, n in zip(u.tolist(), c.tolist()):
+            if h in self._pending:
+                self._pending[h] -= n
+                if self._pending[h] <= 0: del self._pending[h]
+
+    def sync(self, table):
+        if table is None: return
+        with self._lock:
+            epoch, pos, rows, rebuild = table.changes_since(self._epoch, self._pos)
+            if rebuild:
+                self._keys = np.empty(0, dtype=np.uint64)
+                self._counts = np.empty(0, dtype=np.int64)
+            self._epoch, self._pos = epoch, pos
+            if not rows.empty and set(SIG_COLUMNS).issubset(rows.columns): self._add(signature_hashes(rows))
+
+    def __len__(self):
+        return int(self._counts.sum()) + sum(self._pending.values())
+
+    def filter_new(self, rows, headers=HISTORY_HEADERS, force=False):
+        """回傳 (要寫入的列, 略過筆數)，並把要寫入的列記為待寫入；force 時全部寫入。"""
+        if not rows: return [], 0
+        hashes = _row_hashes(rows, headers)
+        with self._lock:
+            seen, keep = {}, []
+            for r, h in zip(rows, hashes):
+                seen[h] = seen.get(h, 0) + 1
+                if force or seen[h] > self._count(h) + self._pending.get(h, 0): keep.append((r, h))
+            for _, h in keep: self._pending[h] = self._pending.get(h, 0) + 1
+        return [r for r, _ in keep], len(rows) - len(keep)
+
+    def release(self, rows, headers=HISTORY_HEADERS):
+        """filter_new 放行但最後沒寫成的列（寫入失敗）不再算待寫入，可以重新存檔。"""
+        if not rows: return
+        hashes = _row_hashes(rows, headers)
+        with self._lock:
+            for h in hashes:
+                if h in self._pending:
+                    self._pending[h] -= 1
+                    if self._pending[h] <= 0: del self._pending[h]
+
+
+# ==========================================
+# 既有重複的清理
+# ==========================================
+def find_duplicates(df):
+    """df 的 index 為工作表列號；回傳應刪除的列號。
+
+    與存檔時的規則一致：一批存檔內相同的組可以有多組，History 中每種完全相同的列
+    只保留「單一批次內出現的最多次數」，超出的部分（較晚的那幾列）視為重複。
+    批次依每位學生自己的列判斷：(Date, Plan, Day) 換了才算新的一批，中間夾著
+    其他學生的列（別的教練同時存檔）不會把同一批切開。
+    """
+    if df.empty: return []
+    df = df.sort_index()
+    cols = [c for c in HISTORY_HEADERS if c in df.columns]
+    full = df[cols].astype(str).apply(lambda s: s.str.strip()).agg("|".join, axis=1)
+    student = df["StudentID"].astype(str).str.strip()
+    batch_key = df[[c for c in ["Date", "Plan", "Day"] if c in df.columns]].astype(str).agg("|".join, axis=1)
+    batch = (batch_key != batch_key.groupby(student).shift()).groupby(student).cumsum()
+    keep = pd.DataFrame({"full": full, "batch": batch}).groupby(["full", "batch"]).size().groupby(level="full").max()
+    occurrence = full.groupby(full).cumcount()
+    return df.index[occurrence.to_numpy() >= full.map(keep).to_numpy()].tolist()
+
+
+def delete_rows(sheet, ws, rows):
+    """一次 batch_update 由下往上刪除多段連續列。"""
+    ranges = []
+    for r in sorted(rows, reverse=True):
+        if ranges and ranges[-1][0] == r + 1: ranges[-1][0] = r
+        else: ranges.append([r, r])
+    requests = [{"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS",
+                                               "startIndex": start - 1, "endIndex": end}}} for start, end in ranges]
+    if requests: sheet.batch_update({"requests": requests})
+
+
+def main():
+    import tomllib
+    from storage import MIRROR_PATH, SQLiteMirror, sheets_backend_from_secrets
+
+    parser = argparse.ArgumentParser(description="找出並刪除 History 中的重複紀錄")
+    parser.add_argument("--apply", action="store_true", help="實際刪除（預設只列出）")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--mirror", help="本機鏡像檔（預設為 secrets 的 mirror_path）")
+    args = parser.parse_args()
+    with open(args.secrets, "rb") as f: mirror_path = args.mirror or tomllib.load(f).get("mirror_path", MIRROR_PATH)
+
+    backend = sheets_backend_from_secrets(args.secrets)
+    ws = backend.worksheet("History")
+    values = ws.get_all_values()
+    df = pd.DataFrame([(r + [""] * len(values[0]))[:len(values[0])] for r in values[1:]],
+                      columns=[str(h).strip() for h in values[0]], index=range(2, len(values) + 1))
+    dups = find_duplicates(df)
+    print(f"History 共 {len(df)} 列，疑似重複 {len(dups)} 列")
+    if dups: print(df.loc[dups].to_string())
+    if args.apply and dups:
+        # 同一組相同內容的列一起確認，只刪除確認過的
+        full = df.loc[dups].astype(str).agg(" | ".join, axis=1)
+        dups = []
+        for text, rows in full.groupby(full, sort=False):
+            ans = input(f"刪除第 {', '.join(map(str, rows.index))} 列（{text}）？[y/N] ")
+            if ans.strip().lower() == "y": dups += rows.index.tolist()
+    if args.apply and dups:
+        # 刪列會讓列號位移：先清掉本機鏡像的 History（之後整表重抓），有未同步的列就不刪
+        if os.path.exists(mirror_path) and not SQLiteMirror(mirror_path).reset("History"):
+            print(f"本機鏡像 {mirror_path} 還有未同步到雲端的 History，請等 App 同步完成後再執行")
+            return 1
+        delete_rows(backend.spreadsheet, ws, dups)
+        print(f"已刪除 {len(dups)} 列；執行中的 App 下次更新時會整表重讀 History")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,139 @@
+"""執行效能監控：工作表讀寫計數 / 計時、程式區段計時、各頁面的 rerun 延遲。
+
+結果可輸出為 dict（結構化 log）或 Prometheus 文字格式。
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+API_METHODS = {"get_all_values", "get_all_records", "get_values", "append_rows", "col_values", "row_values", "update_cell"}
+
+log = logging.getLogger("coach_app.metrics")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.n = 0
+        self.recent = deque(maxlen=500)
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(BUCKETS, v)] += 1
+        self.sum += v
+        self.n += 1
+        self.recent.append(v)
+
+    def quantile(self, q):
+        if not self.recent: return 0.0
+        s = sorted(self.recent)
+        return s[min(int(len(s) * q), len(s) - 1)]
+
+
+class Metrics:
+    def __init__(self):
+        self.api_calls = defaultdict(int)      # (backend, table, method) -> 次數
+        self.api_seconds = defaultdict(float)
+        self.sections = defaultdict(Histogram)  # 區段名稱 -> 耗時分佈
+        self.reruns = defaultdict(Histogram)    # 頁面 -> rerun 耗時分佈（session 數不限，不以它為 key）
+        self._recent_calls = deque()            # 遠端呼叫時間戳，算每分鐘呼叫數
+        self._lock = threading.RLock()
+
+    def record_call(self, backend, table, method, seconds):
+        with self._lock:
+            self.api_calls[(backend, table, method)] += 1
+            self.api_seconds[(backend, table, method)] += seconds
+            if backend == "sheets": self._recent_calls.append(time.time())
+
+    def calls_per_minute(self):
+        with self._lock:
+            cutoff = time.time() - 60
+            while self._recent_calls and self._recent_calls[0] < cutoff: self._recent_calls.popleft()
+            return len(self._recent_calls)
+
+    @contextmanager
+    def timer(self, section):
+        t = time.perf_counter()
+        try: yield
+        finally:
+            with self._lock: self.sections[section].observe(time.perf_counter() - t)
+
+    def observe_rerun(self, page, seconds, session_id=None):
+        # session id 只寫進 log，彙總依頁面，避免每個 session 留下一份分佈
+        with self._lock: self.reruns[page].observe(seconds)
+        log.info(json.dumps({"event": "rerun", "page": page, "session": session_id, "seconds": round(seconds, 4),
+                             "sheets_calls_per_min": self.calls_per_minute()}))
+
+    # --- 輸出 ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "api_calls": [{"backend": b, "table": t, "method": m, "count": n, "seconds": round(self.api_seconds[(b, t, m)], 4)}
+                              for (b, t, m), n in sorted(self.api_calls.items())],
+                "sections": {k: {"count": h.n, "avg_ms": round(h.sum / h.n * 1000, 2) if h.n else 0,
+                                 "p95_ms": round(h.quantile(0.95) * 1000, 2)} for k, h in sorted(self.sections.items())},
+                "reruns": {k: {"count": h.n, "avg_ms": round(h.sum / h.n * 1000, 2) if h.n else 0,
+                               "p95_ms": round(h.quantile(0.95) * 1000, 2)} for k, h in sorted(self.reruns.items())},
+            } | {"sheets_calls_per_min": self.calls_per_minute()}
+
+    def prometheus(self):
+        lines = ["# TYPE coach_sheets_api_calls_total counter"]
+        with self._lock:
+            for (b, t, m), n in sorted(self.api_calls.items()):
+                lines.append(f'coach_sheets_api_calls_total{{backend="{b}",table="{t}",method="{m}"}} {n}')
+            lines.append("# TYPE coach_sheets_api_seconds_total counter")
+            for (b, t, m), s in sorted(self.api_seconds.items()):
+                lines.append(f'coach_sheets_api_seconds_total{{backend="{b}",table="{t}",method="{m}"}} {s:.6f}')
+            for name, label, hists in (("coach_section_seconds", "section", self.sections),
+                                       ("coach_rerun_seconds", "page", self.reruns)):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in sorted(hists.items()):
+                    acc = 0
+                    for le, c in zip(list(BUCKETS) + ["+Inf"], h.counts):
+                        acc += c
+                        lines.append(f'{name}_bucket{{{label}="{key}",le="{le}"}} {acc}')
+                    lines.append(f'{name}_sum{{{label}="{key}"}} {h.sum:.6f}')
+                    lines.append(f'{name}_count{{{label}="{key}"}} {h.n}')
+        lines.append("# TYPE coach_sheets_calls_per_minute gauge")
+        lines.append(f"coach_sheets_calls_per_minute {self.calls_per_minute()}")
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedWorksheet:
+    """包住 worksheet，每次讀寫記錄次數與耗時；其他屬性原樣轉交。"""
+
+    def __init__(self, ws, metrics, backend):
+        self._ws = ws
+        self._metrics = metrics
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if name not in API_METHODS: return attr
+        def call(*args, **kwargs):
+            t = time.perf_counter()
+            try: return attr(*args, **kwargs)
+            finally: self._metrics.record_call(self._backend, self._ws.title, name, time.perf_counter() - t)
+        return call
+
+
+class InstrumentedBackend:
+    def __init__(self, backend, metrics, name):
+        self._backend = backend
+        self._metrics = metrics
+        self._name = name
+
+    def worksheet(self, table):
+        t = time.perf_counter()
+        ws = self._backend.worksheet(table)
+        # 直連 Sheets 時取得 worksheet 本身也是一次 API 呼叫
+        if self._name == "sheets": self._metrics.record_call(self._name, table, "worksheet", time.perf_counter() - t)
+        return InstrumentedWorksheet(ws, self._metrics, self._name)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
@@ -0,0 +1,116 @@
+import re
+
+import pandas as pd
+
+WORKOUT_COLUMNS = ["選取", "編號", "動作名稱", "組數", "計畫次數", "強度", "建議重量", "實際重量", "實際次數", "備註"]
+
+
+def sort_key(d_str):
+    m = re.search(r'W(\d+)D(\d+)', str(d_str), re.IGNORECASE)
+    return (int(m.group(1)), int(m.group(2))) if m else (999, 999)
+
+
+def build_students_dict(df_students):
+    """Students 表 -> {"姓名 (ID)": {"rm": {...}, "cmj_static": float, "memo": str, "checksum": str}}，以欄運算取代 iterrows。
+
+    checksum 取自 _checksum 欄（讀取時該列的 row_checksum），更新時作為樂觀鎖的版本。
+    """
+    if df_students.empty: return {}
+    n = len(df_students)
+    names = df_students["Name"] if "Name" in df_students else pd.Series(["Unknown"] * n, index=df_students.index)
+    sids = df_students["StudentID"] if "StudentID" in df_students else pd.Series(["000"] * n, index=df_students.index)
+    keys = names.astype(str) + " (" + sids.astype(str) + ")"
+
+    rm_cols = [c for c in df_students.columns if "_1RM" in c]
+    rm = df_students[rm_cols].rename(columns=lambda c: c.replace("_1RM", ""))
+    rm_records = [{k: v for k, v in r.items() if pd.notna(v) and v != ""} for r in rm.to_dict("records")]
+
+    raw_cmj = df_students["CMJ_Baseline"] if "CMJ_Baseline" in df_students else pd.Series([0] * n, index=df_students.index)
+    cmj = pd.to_numeric(raw_cmj, errors="coerce").fillna(0.0).astype(float)
+    memo = df_students["Memo"] if "Memo" in df_students else pd.Series([""] * n, index=df_students.index)
+    checksum = df_students["_checksum"] if "_checksum" in df_students else pd.Series([None] * n, index=df_students.index)
+
+    return {k: {"rm": r, "cmj_static": c, "memo": m, "checksum": h}
+            for k, r, c, m, h in zip(keys, rm_records, cmj, memo, checksum)}
+
+
+def rm_frame(student_rm):
+    return pd.DataFrame({"_ex": [str(k) for k in student_rm.keys()],
+                         "_rm": pd.to_numeric(pd.Series(list(student_rm.values()), dtype=object), errors="coerce")})
+
+
+def expand_sets(df_view, student_rm, keep=()):
+    """計畫列 -> 每組一列的訓練表：依動作 merge 1RM、數值轉換後以 repeat 展開組數。
+
+    keep 內的欄位（例如 Day）原樣帶到結果，供一次展開多天後再分組。
+    """
+    if df_view.empty: return pd.DataFrame(columns=WORKOUT_COLUMNS + list(keep))
+    df = df_view.reset_index(drop=True)
+    df = df.assign(_ex=df["Exercise"].astype(str)).merge(rm_frame(student_rm), on="_ex", how="left")
+    return _repeat_sets(df, list(keep))
+
+
+def _repeat_sets(df, keep):
+    # df 已帶 _rm 欄；計算建議重量並依組數展開
+    weight = (df["_rm"].fillna(0) * pd.to_numeric(df["Intensity"], errors="coerce")).fillna(0).astype(int)
+    sets = pd.to_numeric(df["Sets"], errors="coerce").fillna(1).astype(int).clip(lower=0)
+    note = df["Note"] if "Note" in df else pd.Series([""] * len(df))
+
+    idx = df.index.repeat(sets)
+    set_no = pd.Series(idx).groupby(idx).cumcount() + 1
+    out = pd.DataFrame({
+        "選取": False,
+        "編號": df["Order"].astype(str).to_numpy()[idx],
+        "動作名稱": df["Exercise"].to_numpy()[idx],
+        "組數": "Set " + set_no.astype(str),
+        "計畫次數": df["Reps"].to_numpy()[idx],
+        "強度": df["Intensity"].astype(str).to_numpy()[idx],
+        "建議重量": weight.to_numpy()[idx],
+        "實際重量": None,
+        "實際次數": df["Reps"].to_numpy()[idx],
+        "備註": note.to_numpy()[idx],
+    })
+    for c in keep: out[c] = df[c].to_numpy()[idx]
+    return out[WORKOUT_COLUMNS + keep]
+
+
+def expand_mesocycle(df_plan, plan_name, student_rm):
+    """一次展開整個計畫所有 W#D# 的訓練表，依 sort_key 排序，切換進度時直接取用。"""
+    if df_plan.empty: return {}
+    df_p = df_plan[df_plan["Plan_Name"] == plan_name]
+    days = sorted(df_p["Day"].unique().tolist(), key=sort_key)
+    out = expand_sets(df_p, student_rm, keep=("Day",))
+    groups = {d: g.drop(columns="Day").reset_index(drop=True) for d, g in out.groupby("Day", sort=False)}
+    return {d: groups.get(d, pd.DataFrame(columns=WORKOUT_COLUMNS)) for d in days}
+
+
+def team_rm_frame(students_dict, roster):
+    """多位學生的 1RM 攤平成長表 (學生, _ex, _rm)。"""
+    rows = [(k, str(ex), v) for k in roster for ex, v in students_dict.get(k, {}).get("rm", {}).items()]
+    df = pd.DataFrame(rows, columns=["學生", "_ex", "_rm"])
+    df["_rm"] = pd.to_numeric(df["_rm"].astype(object), errors="coerce")
+    return df
+
+
+def expand_team(df_plan, plan_name, day, students_dict, roster):
+    """同一份 Plan/Day 展開給整批學生：計畫列 × 名單後一次 merge 各自的 1RM 算出建議重量。"""
+    columns = ["學生"] + WORKOUT_COLUMNS
+    if df_plan.empty or not roster: return pd.DataFrame(columns=columns)
+    df_view = df_plan[(df_plan["Plan_Name"] == plan_name) & (df_plan["Day"] == day)]
+    if df_view.empty: return pd.DataFrame(columns=columns)
+    df = df_view.reset_index(drop=True).assign(_ord=lambda d: range(len(d)))
+    df = df.merge(pd.DataFrame({"學生": list(roster), "_stu": range(len(roster))}), how="cross")
+    df = df.sort_values(["_stu", "_ord"], kind="stable").reset_index(drop=True)
+    df = df.assign(_ex=df["Exercise"].astype(str)).merge(team_rm_frame(students_dict, roster), on=["學生", "_ex"], how="left")
+    return _repeat_sets(df, ["學生"])[columns]
+
+
+def history_rows(df, date_str, plan_name, day, student=None):
+    """訓練表中有填實際重量或次數的組 -> History 列；團隊表由「學生」欄決定學生。"""
+    if df.empty: return []
+    w = pd.to_numeric(df["實際重量"], errors="coerce")
+    r = pd.to_numeric(df["實際次數"], errors="coerce")
+    done = df[(w > 0) | (r > 0)]
+    students = done["學生"] if student is None else [student] * len(done)
+    return [[date_str, s, plan_name, day, ex, wt, rp, note] for s, ex, wt, rp, note in
+            zip(students, done["動作名稱"], done["實際重量"], done["實際次數"], done["備註"])]
@@ -0,0 +1,96 @@
+"""依近期 History 自動調整的 1RM，補上 Students 表中容易過時的 *_1RM 欄。
+
+只採用接近最大努力的組（次數少，且有記 RPE 時 RPE 夠高），每 (學生, 動作) 每天取
+最佳一組的 e1RM，再取近期的最大值。一般訓練組多半是次最大強度，若取平均，估出的
+1RM 會低於實際，下次處方又以這個較低的值算百分比，越算越低；因此結果也不會低於
+Students 表的 1RM，只有練出更好的成績時才往上調。
+
+只從 History 同步已寫入工作表的列；背景寫入失敗的組不會留下估計值。每個動作只保留
+最近 max_age 天內的每日最佳值，並記住其中的最大值，查詢不必掃描整段紀錄。
+"""
+import threading
+
+from analytics import prepare_sets
+from readiness import day_number
+
+MAX_AGE_DAYS = 90  # 只看這麼多天內的紀錄，更早的不再參考
+MAX_REPS = 5       # 次數太高的組離最大努力太遠，估 1RM 不準，不採用
+MIN_RPE = 8        # 有記 RPE 的組，低於這個值不採用
+
+
+def _number(v):
+    try: return float(v)
+    except (TypeError, ValueError): return None
+
+
+class E1RMIndex:
+    """(學生, 動作) -> 近期最佳 e1RM 的索引；查詢為 dict 取值，O(1)。"""
+
+    def __init__(self, max_age=MAX_AGE_DAYS):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._epoch, self._pos = None, 0
+        self._reset()
+
+    def _reset(self):
+        self._best = {}      # (學生, 動作) -> {日: 當天最佳 e1RM}，只保留最近 max_age 天
+        self._top = {}       # (學生, 動作) -> (最佳 e1RM, 日)，_best 中的最大值
+        self.versions = {}   # 學生 -> 版本，該學生任一動作有變動就遞增，供快取 key 使用
+
+    def sync(self, table):
+        """從 TableCache 取得上次之後合併進來的列並增量更新。"""
+        if table is None: return
+        with self._lock:
+            epoch, pos, rows, rebuild = table.changes_since(self._epoch, self._pos)
+            if rebuild: self._reset()
+            self._epoch, self._pos = epoch, pos
+            self._add(rows)
+
+    def _add(self, df):
+        sets = prepare_sets(df)
+        if sets is None or sets.empty: return
+        near_max = (sets["weight"] > 0) & sets["reps"].between(1, MAX_REPS) & ~(sets["rpe"] < MIN_RPE)
+        sets = sets[near_max]
+        if sets.empty: return
+        # 有記 RPE 的組把保留次數算進去
+        daily = (sets.assign(day=day_number(sets["date"]), e1rm=sets["e1rm_rpe"].fillna(sets["e1rm_epley"]))
+                 .groupby(["student", "exercise", "day"])["e1rm"].max())
+
+        # 轉成 list 再逐一取用，比逐格走訪 pandas 陣列快很多
+        changed = set()
+        for (student, exercise, day), v in zip(daily.index.tolist(), daily.tolist()):
+            days = self._best.setdefault((student, exercise), {})
+            if v > days.get(day, 0):
+                days[day] = v
+                changed.add((student, exercise))
+        for pair in changed:
+            # 以該動作最近一次訓練日為準，丟掉更早的日子，每個動作最多 max_age 筆
+            days = self._best[pair]
+            since = max(days) - self.max_age
+            for d in [d for d in days if d < since]: del days[d]
+            self._top[pair] = max((v, d) for d, v in days.items())
+        for student in {p[0] for p in changed}:
+            self.versions[student] = self.versions.get(student, 0) + 1
+
+    # --- 查詢 ---
+    def get(self, student, exercise, today=None):
+        """近 max_age 天內的最佳 e1RM；沒有紀錄時回傳 None。"""
+        top = self._top.get((student, exercise))
+        if top is None: return None
+        if today is None: return top[0]
+        since = int(day_number([today])[0]) - self.max_age
+        if top[1] >= since: return top[0]
+        # 最佳那天已超過 max_age：從保留的日子（至多 max_age 筆）找窗內的最大值
+        return max((v for d, v in self._best[(student, exercise)].items() if d >= since), default=None)
+
+    def version(self, student):
+        return self.versions.get(student, 0)
+
+    def merged_rm(self, student, sheet_rm, exercises, today=None):
+        """exercises 中每個動作的 1RM：近期 e1RM 比 Students 表的值高時才採用。"""
+        rm = dict(sheet_rm)
+        for ex in exercises:
+            v = self.get(student, str(ex), today)
+            sheet = _number(rm.get(str(ex)))
+            if v is not None and (sheet is None or v > sheet): rm[str(ex)] = int(v)
+        return rm
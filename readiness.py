@@ -0,0 +1,183 @@
+"""運動員準備度：ACWR（急性 / 慢性負荷比）、CMJ 偏差、重點動作 e1RM 趨勢。
+
+負荷與 e1RM 都用指數加權（EWMA）。指數加權對每一筆資料是線性的：日期 d 的一筆
+x 對參考日 T 的貢獻固定是 x·(1−λ)^(T−d)，所以新增的列不論日期先後，都能 O(1)
+併入每個 key 的狀態 (T, Σ, 權重)，不必重算整段歷史。e1RM 趨勢每天只取最佳一組，
+熱身、退階組與減量週的輕重量不會被當成退步。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from analytics import CMJ_EXERCISE, prepare_sets
+
+ACUTE_DAYS, CHRONIC_DAYS = 7, 28
+TREND_SHORT, TREND_LONG = 14, 56
+MIN_HISTORY_DAYS = 21  # 慢性負荷至少要累積這麼久，ACWR 才有意義
+
+ACWR_HIGH, ACWR_LOW = 1.5, 0.8
+CMJ_DROP = -0.10
+E1RM_DROP = -0.05
+
+
+def day_number(dates):
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+class DecayedSums:
+    """每個 key 的 Σ x·(1−λ)^(T−d) 與 Σ (1−λ)^(T−d)，λ = 2 / (span + 1)。"""
+
+    def __init__(self, span):
+        self.keep = 1 - 2 / (span + 1)
+        self.state = {}  # key -> [T, Σx, Σw]
+
+    def add(self, keys, days, values, weights=1.0):
+        """weights 為 0 的項目只改 Σx（用來把某天的舊值換成新值）。"""
+        # 同一批內先以 numpy 在各 key 的最大日期上加總，再與既有狀態合併
+        df = pd.DataFrame({"k": keys, "d": days, "x": values, "w": weights}).dropna()
+        if df.empty: return
+        t = df.groupby("k")["d"].transform("max")
+        f = self.keep ** (t - df["d"]).to_numpy(dtype=float)
+        agg = (df.assign(t=t, sx=df["x"].to_numpy() * f, sw=df["w"].to_numpy() * f)
+               .groupby("k").agg(t=("t", "max"), sx=("sx", "sum"), sw=("sw", "sum")))
+        for k, t, sx, sw in agg.itertuples():
+            old = self.state.get(k)
+            if old is not None:
+                T = max(t, old[0])
+                sx = sx * self.keep ** (T - t) + old[1] * self.keep ** (T - old[0])
+                sw = sw * self.keep ** (T - t) + old[2] * self.keep ** (T - old[0])
+                t = T
+            self.state[k] = [int(t), sx, sw]
+
+    def total(self, key, day):
+        s = self.state.get(key)
+        return s[1] * self.keep ** max(day - s[0], 0) if s else None
+
+    def mean(self, key):
+        s = self.state.get(key)
+        return s[1] / s[2] if s and s[2] else None
+
+
+class DailyBest:
+    """每 (key, 日) 只保留當天最佳值，併入一或多組 DecayedSums。
+
+    新的一天加入 (值, 權重 1)；同一天出現更好的值時只把差值加進 Σx，不重算其他天；
+    同一筆重複加入不影響結果。
+    """
+
+    def __init__(self, *sums):
+        self.sums = sums
+        self.best = {}  # (key, 日) -> 當天最佳值
+
+    def add(self, keys, days, values):
+        """回傳當天最佳值有變動的 [(key, 日)]。"""
+        df = pd.DataFrame({"k": keys, "d": days, "x": values}).dropna()
+        if df.empty: return []
+        daily = df.groupby(["k", "d"])["x"].max()
+        # 轉成 list 再逐一取用，比逐格走訪 pandas 陣列快很多
+        pairs = daily.index.tolist()
+        old = np.array([self.best.get(p, np.nan) for p in pairs], dtype=float)
+        new = daily.to_numpy(dtype=float)
+        is_new_day = np.isnan(old)
+        idx = np.flatnonzero(is_new_day | (new > old))
+        if not len(idx): return []
+
+        changed = [pairs[i] for i in idx]
+        delta = np.where(is_new_day, new, new - np.nan_to_num(old))[idx]
+        for sums in self.sums:
+            sums.add([p[0] for p in changed], [p[1] for p in changed], delta, is_new_day[idx].astype(float))
+        self.best.update((pairs[i], new[i]) for i in idx)
+        return changed
+
+
+class ReadinessEngine:
+    """由 History 增量維護的每位學生負荷 / CMJ / e1RM 狀態，所有 session 共用。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch, self._pos = None, 0
+        self._reset()
+
+    def _reset(self):
+        self.acute = DecayedSums(ACUTE_DAYS)        # key: 學生，值為每日噸位
+        self.chronic = DecayedSums(CHRONIC_DAYS)
+        self.short = DecayedSums(TREND_SHORT)       # key: (學生, 動作)，值為當天最佳 e1RM
+        self.long = DecayedSums(TREND_LONG)
+        self.daily_e1rm = DailyBest(self.short, self.long)
+        self.first_day = {}
+        self.cmj = {}       # 學生 -> (日期, 高度)
+        self.cmj_base = {}  # 學生 -> 最後一筆 CMJ 備註中的 Base:
+
+    def sync(self, table):
+        """從 TableCache 取得上次之後合併進來的列並增量更新。"""
+        if table is None: return
+        with self._lock:
+            epoch, pos, rows, rebuild = table.changes_since(self._epoch, self._pos)
+            if rebuild: self._reset()
+            self._epoch, self._pos = epoch, pos
+            self._add(rows)
+
+    def _add(self, df):
+        sets = prepare_sets(df)
+        if sets is None or sets.empty: return
+        days = day_number(sets["date"])
+        is_cmj = (sets["exercise"] == CMJ_EXERCISE).to_numpy().copy()
+        # prepare_sets 的 index 是 df 中的位置（已去掉日期無效的列）
+        if "Plan" in df: is_cmj |= df["Plan"].astype(str).to_numpy()[sets.index] == "CMJ_Check"
+
+        train = ~is_cmj
+        self.acute.add(sets["student"][train], days[train], sets["tonnage"][train])
+        self.chronic.add(sets["student"][train], days[train], sets["tonnage"][train])
+        for stu, d in pd.Series(days[train]).groupby(sets["student"][train].to_numpy()).min().items():
+            self.first_day[stu] = min(self.first_day.get(stu, d), d)
+
+        lift = train & (sets["weight"] > 0).to_numpy() & (sets["reps"].between(1, 10)).to_numpy()
+        keys = list(zip(sets["student"][lift].tolist(), sets["exercise"][lift].tolist()))
+        self.daily_e1rm.add(keys, days[lift], sets["e1rm_epley"][lift].to_numpy())
+
+        if is_cmj.any():
+            cmj = pd.DataFrame({"student": sets["student"][is_cmj], "d": days[is_cmj], "h": sets["reps"][is_cmj]}).dropna()
+            for stu, d, h in cmj.sort_values("d", kind="stable").groupby("student").tail(1).itertuples(index=False):
+                if stu not in self.cmj or d >= self.cmj[stu][0]: self.cmj[stu] = (int(d), float(h))
+            if "Note" in df:
+                notes = pd.Series(df["Note"].astype(str).to_numpy()[cmj.index], index=cmj.index)
+                base = pd.to_numeric(notes.str.extract(r"Base:\s*([\d.]+)", expand=False), errors="coerce")
+                for stu, b in base.groupby(cmj["student"]).last().dropna().items():
+                    self.cmj_base[stu] = float(b)
+
+    # --- 查詢（皆為 O(1)）---
+    def athlete(self, student, today, cmj_base=0.0, lifts=()):
+        day = int(day_number([today])[0])
+        with self._lock:
+            acute, chronic = self.acute.total(student, day), self.chronic.total(student, day)
+            enough = student in self.first_day and day - self.first_day[student] >= MIN_HISTORY_DAYS
+            acwr = acute * (2 / (ACUTE_DAYS + 1)) / (chronic * (2 / (CHRONIC_DAYS + 1))) if enough and chronic else None
+            cmj = self.cmj.get(student)
+            base = cmj_base or self.cmj_base.get(student, 0.0)
+            trends = {}
+            for lift in lifts:
+                s, l = self.short.mean((student, lift)), self.long.mean((student, lift))
+                trends[lift] = s / l - 1 if s and l else None
+
+        flags = []
+        if acwr is not None and acwr > ACWR_HIGH: flags.append(f"負荷驟增 (ACWR {acwr:.2f})")
+        elif acwr is not None and acwr < ACWR_LOW: flags.append(f"負荷偏低 (ACWR {acwr:.2f})")
+        cmj_dev = cmj[1] / base - 1 if cmj and base else None
+        if cmj_dev is not None and cmj_dev < CMJ_DROP: flags.append(f"CMJ 低於基準 {cmj_dev:.0%}")
+        for lift, t in trends.items():
+            if t is not None and t < E1RM_DROP: flags.append(f"{lift} e1RM 下滑 {t:.0%}")
+        return {"acwr": acwr, "cmj": cmj[1] if cmj else None, "cmj_dev": cmj_dev, "trends": trends, "flags": flags}
+
+    def squad(self, students_dict, today, lifts=()):
+        """每位學生一列的總覽，需注意的排在前面。"""
+        rows = []
+        for student, data in students_dict.items():
+            r = self.athlete(student, today, float(data.get("cmj_static", 0) or 0), lifts)
+            rows.append({"學生": student, "ACWR": r["acwr"], "CMJ": r["cmj"], "CMJ 偏差": r["cmj_dev"],
+                         **{f"{lift} 趨勢": t for lift, t in r["trends"].items()},
+                         "注意事項": "、".join(r["flags"])})
+        df = pd.DataFrame(rows)
+        if df.empty: return df
+        df["ACWR"] = df["ACWR"].astype(float)
+        return df.sort_values(["注意事項", "學生"], key=lambda s: s.eq("") if s.name == "注意事項" else s).reset_index(drop=True)
@@ -0,0 +1,87 @@
+"""History 類表的欄位型別：讀進快取時轉換一次，之後的篩選 / 分組都在型別化的欄位上進行。
+
+- 學生、動作、計畫等重複出現的文字 -> category（類別依字母排序，codes 順序即字串順序）
+- 重量、次數等數值 -> float32
+- 日期 -> datetime64
+其餘欄位（Note 等）維持字串。
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+COLUMN_TYPES = {
+    "History": {"category": ["StudentID", "Plan", "Day", "Exercise"], "float": ["Weight", "Reps"], "date": "Date"},
+    # Warmup_History 的 Reps 是「次數/時間」（例如 30s），保留字串
+    "Warmup_History": {"category": ["StudentID", "Module", "Exercise"], "float": ["Sets"], "date": "Date"},
+    "Body_Composition": {"category": ["StudentID"], "float": ["Weight", "Fat", "Muscle"], "date": "Date"},
+}
+SORT_KEYS = ["StudentID", "Date"]
+
+
+def parse_dates(s):
+    # 絕大多數是 YYYY-MM-DD，先用固定格式快速解析，剩下的再逐一判斷
+    d = pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
+    bad = d.isna() & s.astype(str).str.strip().ne("")
+    if bad.any(): d[bad] = pd.to_datetime(s[bad], errors="coerce", format="mixed")
+    return d
+
+
+def typed_frame(df, table):
+    """原始字串欄位 -> 型別化欄位；沒有定義型別的表原樣回傳。"""
+    types = COLUMN_TYPES.get(table)
+    if types is None or df.empty: return df
+    df = df.copy()
+    for c in types["category"]:
+        if c not in df: continue
+        s = df[c].astype(str).str.strip()
+        df[c] = pd.Categorical(s, categories=sorted(s.unique()))
+    for c in types["float"]:
+        if c in df: df[c] = pd.to_numeric(df[c], errors="coerce").astype(np.float32)
+    if types["date"] in df: df[types["date"]] = parse_dates(df[types["date"]])
+    return df
+
+
+def concat_typed(frames):
+    """合併型別化的 DataFrame；category 欄先統一類別（排序後），避免 concat 退回 object。"""
+    frames = [f for f in frames if not f.empty]
+    if len(frames) <= 1: return frames[0] if frames else pd.DataFrame()
+    frames = [f.copy(deep=False) for f in frames]
+    for c in frames[0].columns:
+        if not isinstance(frames[0][c].dtype, pd.CategoricalDtype) or not all(c in f for f in frames): continue
+        dtype = frames[0][c].dtype
+        if not all(f[c].astype(str).isin(dtype.categories).all() for f in frames[1:]):
+            # 出現新的類別（新學生 / 新動作）才需要重編整欄
+            dtype = pd.CategoricalDtype(union_categoricals([f[c].astype("category") for f in frames], sort_categories=True).categories)
+        for f in frames:
+            if f[c].dtype != dtype: f[c] = f[c].astype(str).astype(dtype) if not isinstance(f[c].dtype, pd.CategoricalDtype) else f[c].cat.set_categories(dtype.categories)
+    return pd.concat(frames)
+
+
+def sort_by_student_date(df):
+    """依 (StudentID, Date) 排序；category 的類別已排序，因此等同字串排序。"""
+    if df.empty or not set(SORT_KEYS).issubset(df.columns): return df.reset_index(drop=True)
+    return df.sort_values(SORT_KEYS, kind="stable", na_position="last").reset_index(drop=True)
+
+
+def select_rows(df, student=None, start=None, end=None):
+    """在依 (StudentID, Date) 排序的 frame 上以二分搜尋切出學生 / 日期範圍，不掃描整張表。"""
+    if df.empty or not set(SORT_KEYS).issubset(df.columns): return df
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+    if student is None:
+        # 沒指定學生時，日期分散在各學生的區段裡，只能用遮罩
+        mask = pd.Series(True, index=df.index)
+        if start is not None: mask &= df["Date"] >= start
+        if end is not None: mask &= df["Date"] < end
+        return df[mask]
+    col = df["StudentID"]
+    if not isinstance(col.dtype, pd.CategoricalDtype) or student not in col.cat.categories: return df.iloc[0:0]
+    codes, code = col.cat.codes.to_numpy(), col.cat.categories.get_loc(student)
+    lo, hi = np.searchsorted(codes, code, "left"), np.searchsorted(codes, code, "right")
+    dates = df["Date"].to_numpy()[lo:hi]
+    a = np.searchsorted(dates, start.to_datetime64(), "left") if start is not None else 0
+    # NaT 排在每位學生區段的最後；有日期條件時不算在範圍內（與遮罩的結果一致）
+    if end is not None: b = np.searchsorted(dates, end.to_datetime64(), "left")
+    elif start is not None: b = np.searchsorted(dates, np.datetime64("NaT"), "left")
+    else: b = len(dates)
+    return df.iloc[lo + a:lo + b]
@@ -0,0 +1,322 @@
+import collections
+import hashlib
+import re
+import threading
+import time
+
+import pandas as pd
+
+from schema import COLUMN_TYPES, concat_typed, select_rows, sort_by_student_date, typed_frame
+
+DB_NAME = "Coach_System_DB"
+STATIC_TABLES = ("Students", "Plan", "ExerciseDB", "Warmup_Modules")
+HISTORY_TABLES = ("History", "Warmup_History", "Body_Composition")
+
+
+def clean_columns(df):
+    if not df.empty: df.columns = df.columns.astype(str).str.strip()
+    return df
+
+
+def row_checksum(row):
+    """一列內容的短雜湊，作為樂觀鎖的列版本；忽略尾端空白儲存格。"""
+    cells = [str(v) for v in row]
+    while cells and cells[-1] == "": cells.pop()
+    return hashlib.sha1("\x1f".join(cells).encode("utf-8")).hexdigest()[:16]
+
+
+def numericise(v):
+    """與 gspread.utils.numericise 相同的規則；自己實作，App 啟動時不必載入 gspread。"""
+    if not isinstance(v, str) or "_" in v: return v
+    s = v.replace(",", "")
+    try: return int(s)
+    except ValueError:
+        try: return float(s)
+        except ValueError: return v
+
+
+def numericise_all(values):
+    return [numericise(v) for v in values]
+
+
+def column_letter(n):
+    """第 n 欄的欄名：1 -> A、27 -> AA。"""
+    label = ""
+    while n:
+        n, mod = divmod(n - 1, 26)
+        label = chr(65 + mod) + label
+    return label
+
+
+def _cell_key(v):
+    s = str(v).strip()
+    try: return float(s)
+    except ValueError: return s
+
+
+def same_row(a, b):
+    """兩列內容是否相同；"100" 與 100.0 視為相同，忽略尾端空白儲存格。"""
+    a, b = [_cell_key(v) for v in a or []], [_cell_key(v) for v in b or []]
+    while a and a[-1] == "": a.pop()
+    while b and b[-1] == "": b.pop()
+    return a == b
+
+
+def records_frame(values):
+    """get_all_values 的結果 -> 與 get_all_records 相同（數字已轉型）的 DataFrame。"""
+    if not values: return pd.DataFrame()
+    n = len(values[0])
+    return clean_columns(pd.DataFrame([numericise_all((list(r) + [""] * n)[:n]) for r in values[1:]], columns=values[0]))
+
+
+class WriteConflict(Exception):
+    """寫入前發現該列已被其他人修改。"""
+
+
+class ConflictLog:
+    """樂觀鎖衝突紀錄。依學生 key 取出後即移除（只提示做修改的那位學生一次），逾時自動丟棄。"""
+
+    def __init__(self, ttl=600, maxlen=100):
+        self.ttl = ttl
+        self._items = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, table, key, message):
+        with self._lock: self._items.append({"table": table, "key": key, "message": message, "time": time.time()})
+
+    def _keep(self, pred):
+        # 回傳被移除的項目；已逾時的一併丟掉
+        now, out, keep = time.time(), [], []
+        for c in self._items:
+            if now - c["time"] >= self.ttl: continue
+            (out if pred(c) else keep).append(c)
+        self._items = collections.deque(keep, maxlen=self._items.maxlen)
+        return out
+
+    def take(self, key):
+        """取出並移除這位學生的衝突（"001" 與 "1" 視為同一位）。"""
+        with self._lock: return self._keep(lambda c: c["key"] is not None and same_row([c["key"]], [key]))
+
+    def clear(self, table):
+        """重新整理過該表後，之前的衝突提示不再需要。"""
+        with self._lock: self._keep(lambda c: c["table"] == table)
+
+    def __len__(self):
+        with self._lock:
+            self._keep(lambda c: False)
+            return len(self._items)
+
+
+class TableNotFound(KeyError):
+    """後端確定沒有這張工作表（不是連線失敗）。"""
+
+
+def _range_start_row(resp):
+    # append_rows 回傳的 updatedRange 例如 "History!A120:H122"
+    try:
+        m = re.search(r"![A-Z]+(\d+)", resp["updates"]["updatedRange"])
+        return int(m.group(1))
+    except Exception:
+        return None
+
+
+class TableVersions:
+    """每張工作表的版本戳。以版本當快取 key 的讀取函式在 bump 後自然失效，其他表不受影響。"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        return self._versions.get(name, 0)
+
+    def bump(self, *names):
+        with self._lock:
+            for name in names: self._versions[name] = self._versions.get(name, 0) + 1
+
+
+class TableCache:
+    """單一工作表的記憶體快取：首次完整讀取，之後只抓上次列數之後新增的列。
+
+    DataFrame 的 index 是工作表列號，本地寫入的列依 append 回傳的位置合併，
+    因此下次增量讀取不會重複，也不會漏掉其他教練插在中間的列。增量讀取時連同
+    已知的最後一列一起抓，內容對不上代表工作表被刪過列（例如 dedup.py），改為完整重讀。
+    有定義在 schema.COLUMN_TYPES 的表在讀進來時就轉成型別化欄位；frame 依
+    (StudentID, Date) 排序，所有 session 共用同一份（pandas copy-on-write，唯讀）。
+    """
+
+    def __init__(self, ws, min_interval=15):
+        self.ws = ws
+        self.title = ws.title
+        self.min_interval = min_interval
+        self.headers = []
+        self._df = pd.DataFrame()
+        self._next_row = 2  # 第 1 列為標題
+        self._last_row = None  # 第 _next_row - 1 列的內容，用來偵測刪列
+        self._last_fetch = 0.0
+        self._staged = {}  # 尚未寫出的列（write-behind），key 為佇列工作 id
+        self._view = None
+        self.version = 0  # 內容每變動一次遞增，供下游快取比對
+        self._epoch = 0   # 每次完整 reload 遞增，下游需整批重建
+        self._log = []    # 本 epoch 內每次合併進來的列號，供下游增量更新
+        self._lock = threading.RLock()
+
+    def _to_frame(self, rows, start_row):
+        n = len(self.headers)
+        rows = [(list(r) + [""] * n)[:n] for r in rows]
+        # 型別化的表直接以欄為單位轉換，不必逐格 numericise
+        if self.title not in COLUMN_TYPES: rows = [numericise_all(r) for r in rows]
+        df = pd.DataFrame(rows, columns=self.headers, index=range(start_row, start_row + len(rows)))
+        # 空白列保留列號但不放進快取
+        if rows: df = df[[any(str(v).strip() for v in r) for r in rows]]
+        return typed_frame(df, self.title)
+
+    def _merge(self, df_new):
+        if df_new.empty: return
+        if self._df.empty: self._df = df_new
+        else:
+            df = concat_typed([self._df, df_new])
+            df_new = df_new[~df_new.index.isin(self._df.index)]
+            self._df = df[~df.index.duplicated(keep="first")].sort_index()
+        self._log.append(df_new.index)
+        self._view = None
+        self.version += 1
+
+    def reload(self):
+        with self._lock:
+            values = self.ws.get_all_values()
+            self.headers = [str(h).strip() for h in values[0]] if values else []
+            self._df = self._to_frame(values[1:], 2) if self.headers else pd.DataFrame()
+            self._next_row = 2 + max(len(values) - 1, 0)
+            self._last_row = values[-1] if len(values) > 1 else None
+            self._last_fetch = time.time()
+            self._view = None
+            self.version += 1
+            self._epoch += 1
+            self._log = []
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not self.headers: return self.reload()
+            if not force and time.time() - self._last_fetch < self.min_interval: return
+            end_col = column_letter(len(self.headers))
+            check = self._last_row is not None
+            rows = self.ws.get_values(f"A{self._next_row - check}:{end_col}")
+            if check:
+                if not same_row(rows[0] if rows else [], self._last_row): return self.reload()
+                rows = rows[1:]
+            if rows: self._last_row = rows[-1]
+            self._merge(self._to_frame(rows, self._next_row))
+            self._next_row += len(rows)
+            self._last_fetch = time.time()
+
+    def _write(self, rows):
+        resp = self.ws.append_rows(rows)
+        start = _range_start_row(resp) or self._next_row
+        self._merge(self._to_frame(rows, start))
+        # 只有緊接在已知範圍後面時才往前推，中間的空隙留給下次增量讀取補上
+        if start == self._next_row:
+            self._next_row += len(rows)
+            self._last_row = rows[-1]
+        return resp
+
+    def append_rows(self, rows):
+        """寫入工作表並立即合併到快取，不觸發重新讀取。"""
+        rows = [list(r) for r in rows]
+        if not rows: return None
+        with self._lock:
+            return self._write(rows)
+
+    def stage(self, key, rows):
+        """先放進快取讓畫面立即看得到，稍後由 commit_staged 寫入工作表；已暫存的 key 不重複放。"""
+        with self._lock:
+            if key in self._staged: return
+            self._staged[key] = [list(r) for r in rows]
+            self._view = None
+            self.version += 1
+
+    def discard(self, key):
+        with self._lock:
+            if self._staged.pop(key, None) is not None:
+                self._view = None
+                self.version += 1
+
+    def commit_staged(self, keys):
+        """把多筆暫存合併成一次 append_rows 寫出；持鎖進行，避免增量讀取同時抓到同一批列。"""
+        with self._lock:
+            keys = [k for k in keys if k in self._staged]
+            rows = [r for k in keys for r in self._staged[k]]
+            if not rows: return None
+            resp = self._write(rows)
+            for k in keys: del self._staged[k]
+            return resp
+
+    def changes_since(self, epoch, pos):
+        """回傳 (epoch, pos, 新列 DataFrame, 是否需整批重建)；只含已寫入工作表的列。"""
+        with self._lock:
+            if epoch != self._epoch:
+                return self._epoch, len(self._log), clean_columns(self._df.copy(deep=False)), True
+            new = self._log[pos:]
+            rows = self._df.loc[new[0].append(new[1:])] if new else self._df.iloc[0:0]
+            return epoch, len(self._log), clean_columns(rows), False
+
+    @property
+    def frame(self):
+        with self._lock:
+            if self._view is None:
+                staged = [r for rows in self._staged.values() for r in rows]
+                df = concat_typed([self._df, self._to_frame(staged, 0)])
+                self._view = sort_by_student_date(clean_columns(df)) if not df.empty else pd.DataFrame()
+            return self._view.copy(deep=False)
+
+    def select(self, student=None, start=None, end=None):
+        """frame 中某位學生 / 日期範圍的列，以 (StudentID, Date) 排序做二分搜尋。"""
+        return select_rows(self.frame, student, start, end)
+
+
+class HistoryStore:
+    """History / Warmup_History / Body_Composition 的共用快取；每張表第一次用到時才讀取。"""
+
+    def __init__(self, sheet, min_interval=15):
+        self.sheet = sheet
+        self.min_interval = min_interval
+        self.tables = {}
+        self._locks = {name: threading.Lock() for name in HISTORY_TABLES}
+        self._prefetching = set()
+        self._prefetch_lock = threading.Lock()
+
+    def prefetch(self, name, executor):
+        """在 executor 背景讀取 name；已讀取或已在讀取中就不重複送出。"""
+        with self._prefetch_lock:
+            if name not in self._locks or name in self.tables or name in self._prefetching: return
+            self._prefetching.add(name)
+
+        def load():
+            try: self.table(name)
+            finally:
+                with self._prefetch_lock: self._prefetching.discard(name)
+        executor.submit(load)
+
+    def reload(self, name):
+        """完整重讀已載入的表；之前找不到的表清掉記錄，下次使用時重新查詢。"""
+        t = self.tables.get(name)
+        if t is not None: t.reload()
+        else: self.tables.pop(name, None)
+
+    def table(self, name, load=True):
+        """回傳 TableCache；load=False 時只看已讀取的表，不觸發讀取。
+
+        工作表確定不存在時記住 None；連線等其他錯誤不記住，回傳 None 並於下次呼叫重試。
+        """
+        if name not in self._locks or name in self.tables or not load: return self.tables.get(name)
+        with self._locks[name]:
+            if name not in self.tables:
+                try: ws = self.sheet.worksheet(name)
+                except TableNotFound: ws = None
+                except Exception: return None
+                t = TableCache(ws, self.min_interval) if ws is not None else None
+                if t is not None:
+                    try: t.refresh()
+                    except Exception: pass  # 讀取失敗時先給空表，下次 refresh 再試
+                self.tables[name] = t
+        return self.tables[name]
@@ -0,0 +1,364 @@
+"""Coach_System_DB 的儲存後端。
+
+所有後端提供同一個介面：``backend.worksheet(name)`` 回傳一個具備 gspread
+Worksheet 子集合（title / get_all_values / get_all_records / get_values /
+append_rows / col_values / row_values / update_cell）的物件，其餘程式碼不需知道資料
+實際存在 Google Sheets、記憶體或本地 SQLite。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from sheets_db import DB_NAME, STATIC_TABLES, HISTORY_TABLES, ConflictLog, TableNotFound, numericise_all, row_checksum, same_row
+
+ALL_TABLES = STATIC_TABLES + HISTORY_TABLES
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+MIRROR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "coach_db.sqlite")
+
+
+def _range_rows(range_name):
+    # 只支援本程式用到的 "A{row}:{col}" / "A{row}:{col}{row}" 形式，回傳 (起始列, 結束列或 None)
+    m = re.match(r"[A-Z]+(\d+)(?::[A-Z]+(\d+))?", range_name or "")
+    if not m: return 1, None
+    return int(m.group(1)), int(m.group(2)) if m.group(2) else None
+
+
+def _records(values):
+    if not values: return []
+    headers = values[0]
+    return [dict(zip(headers, numericise_all((list(r) + [""] * len(headers))[:len(headers)]))) for r in values[1:]]
+
+
+def _str(v):
+    return "" if v is None else str(v)
+
+
+# ==========================================
+# 記憶體後端（離線測試 / benchmark 用）
+# ==========================================
+class MemoryWorksheet:
+    def __init__(self, title, values=None):
+        self.title = title
+        self.values = [[_str(v) for v in r] for r in (values or [])]
+        self._lock = threading.Lock()
+
+    def get_all_values(self):
+        with self._lock: return [list(r) for r in self.values]
+
+    def get_all_records(self):
+        return _records(self.get_all_values())
+
+    def get_values(self, range_name=None):
+        start, end = _range_rows(range_name)
+        with self._lock: return [list(r) for r in self.values[start - 1:end]]
+
+    def append_rows(self, rows, **kwargs):
+        with self._lock:
+            start = len(self.values) + 1
+            self.values += [[_str(v) for v in r] for r in rows]
+            return {"updates": {"updatedRange": f"{self.title}!A{start}:A{len(self.values)}", "updatedRows": len(rows)}}
+
+    def col_values(self, col):
+        with self._lock: return [r[col - 1] if len(r) >= col else "" for r in self.values]
+
+    def row_values(self, row):
+        with self._lock: return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def update_cell(self, row, col, value):
+        with self._lock:
+            r = self.values[row - 1]
+            r += [""] * (col - len(r))
+            r[col - 1] = _str(value)
+
+
+class MemoryBackend:
+    def __init__(self, tables=None):
+        self.tables = {name: MemoryWorksheet(name, values) for name, values in (tables or {}).items()}
+
+    def worksheet(self, name):
+        if name not in self.tables: raise TableNotFound(name)
+        return self.tables[name]
+
+
+# ==========================================
+# Google Sheets 後端
+# ==========================================
+class SheetsBackend:
+    def __init__(self, client, db_name=DB_NAME):
+        self.client = client
+        self.db_name = db_name
+        self._sheet = None
+
+    @property
+    def spreadsheet(self):
+        if self._sheet is None: self._sheet = self.client.open(self.db_name)
+        return self._sheet
+
+    def worksheet(self, name):
+        from gspread.exceptions import WorksheetNotFound
+        try: return self.spreadsheet.worksheet(name)
+        except WorksheetNotFound: raise TableNotFound(name) from None
+
+
+def sheets_backend_from_secrets(path=".streamlit/secrets.toml"):
+    """命令列工具用：以 Streamlit secrets 檔中的服務帳號連線。"""
+    import tomllib
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    with open(path, "rb") as f: creds_dict = tomllib.load(f)["gcp_service_account"]
+    return SheetsBackend(gspread.authorize(Credentials.from_service_account_info(creds_dict, scopes=SCOPES)))
+
+
+# ==========================================
+# 本地 SQLite 鏡像
+# ==========================================
+class MirrorWorksheet:
+    """SQLite 鏡像中的一張表；列號以本地順序計算（第 1 列為標題）。"""
+
+    def __init__(self, mirror, title):
+        self.mirror = mirror
+        self.title = title
+
+    def get_all_values(self):
+        return self.mirror._values(self.title)
+
+    def get_all_records(self):
+        return _records(self.get_all_values())
+
+    def get_values(self, range_name=None):
+        return self.mirror._values(self.title, *_range_rows(range_name))
+
+    def append_rows(self, rows, **kwargs):
+        return self.mirror._append(self.title, rows)
+
+    def col_values(self, col):
+        return [r[col - 1] if len(r) >= col else "" for r in self.get_all_values()]
+
+    def row_values(self, row):
+        values = self.mirror._values(self.title, row, row)
+        return values[0] if values else []
+
+    def update_cell(self, row, col, value):
+        self.mirror._update_cell(self.title, row, col, value)
+
+
+class SQLiteMirror:
+    """Coach_System_DB 的本地鏡像：讀取全部走 SQLite，背景執行緒雙向同步。
+
+    - 本地新增的列 remote_row 為 NULL，同步時批次 append 到遠端並記下遠端列號。
+    - History 類表依遠端列號增量拉取；靜態表（Students 等）整表比對後替換。
+      增量拉取時一併比對上次最後一列，遠端刪過列（列號位移）就改為整表替換。
+    - 遠端連不上時照常讀寫本地資料，恢復連線後自動補同步。
+    """
+
+    def __init__(self, path, remote=None, on_change=None):
+        self.path = path
+        self.remote = remote
+        self.on_change = on_change
+        self.online = remote is not None
+        self.last_sync = None
+        self.last_error = ""
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()  # 同一時間只有一個同步在跑，避免同一批本地列被推送兩次
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (tbl TEXT PRIMARY KEY, headers TEXT, next_remote INTEGER);
+            CREATE TABLE IF NOT EXISTS rows (
+                tbl TEXT, rid INTEGER, remote_row INTEGER, student TEXT, date TEXT, data TEXT,
+                PRIMARY KEY (tbl, rid));
+            CREATE INDEX IF NOT EXISTS idx_rows_student ON rows (tbl, student, date);
+            CREATE INDEX IF NOT EXISTS idx_rows_remote ON rows (tbl, remote_row);
+            CREATE TABLE IF NOT EXISTS updates (id INTEGER PRIMARY KEY, tbl TEXT, remote_row INTEGER, col INTEGER, value TEXT, base TEXT);
+        """)
+        try: self._conn.execute("ALTER TABLE updates ADD COLUMN base TEXT")  # 舊版鏡像檔沒有 base 欄
+        except sqlite3.OperationalError: pass
+        self.conflicts = ConflictLog()
+        self._thread = None
+
+    # --- 後端介面 ---
+    def worksheet(self, name):
+        if self._headers(name) is None:
+            # 第一次使用這張表：本地沒有就先從遠端拉一次
+            if self.remote is not None:
+                try:
+                    with self._sync_lock: self._pull(name)
+                except Exception as e:
+                    self.online = False
+                    self.last_error = str(e)
+                    # 連線失敗不代表沒有這張表，讓呼叫端之後重試
+                    if self._headers(name) is None: raise
+            if self._headers(name) is None: raise TableNotFound(name)
+        return MirrorWorksheet(self, name)
+
+    @property
+    def has_data(self):
+        with self._lock: return self._conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0] > 0
+
+    def status(self):
+        with self._lock:
+            dirty = self._conn.execute("SELECT COUNT(*) FROM rows WHERE remote_row IS NULL").fetchone()[0]
+            dirty += self._conn.execute("SELECT COUNT(*) FROM updates").fetchone()[0]
+        return {"online": self.online, "dirty": dirty, "last_sync": self.last_sync, "last_error": self.last_error}
+
+    def reset(self, tbl):
+        """丟掉本地的整張表，下次使用時從遠端完整重抓；有未同步資料時不動作。"""
+        with self._lock, self._conn:
+            dirty = self._conn.execute("SELECT COUNT(*) FROM rows WHERE tbl=? AND remote_row IS NULL", (tbl,)).fetchone()[0]
+            if dirty: return False
+            self._conn.execute("DELETE FROM rows WHERE tbl=?", (tbl,))
+            self._conn.execute("DELETE FROM updates WHERE tbl=?", (tbl,))
+            self._conn.execute("DELETE FROM meta WHERE tbl=?", (tbl,))
+        return True
+
+    # --- 本地讀寫 ---
+    def _headers(self, tbl):
+        with self._lock: row = self._conn.execute("SELECT headers FROM meta WHERE tbl=?", (tbl,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _values(self, tbl, start=1, end=None):
+        with self._lock:
+            headers = self._headers(tbl)
+            if headers is None: raise TableNotFound(tbl)
+            offset = max(start - 2, 0)
+            limit = -1 if end is None else max(end - max(start, 2) + 1, 0)
+            cur = self._conn.execute("SELECT data FROM rows WHERE tbl=? ORDER BY rid LIMIT ? OFFSET ?", (tbl, limit, offset))
+            rows = [json.loads(d) for (d,) in cur]
+        return ([headers] if start <= 1 else []) + rows
+
+    def _insert(self, tbl, rows, remote_rows):
+        headers = self._headers(tbl) or []
+        i_stu = headers.index("StudentID") if "StudentID" in headers else None
+        i_date = headers.index("Date") if "Date" in headers else None
+        rid = self._conn.execute("SELECT COALESCE(MAX(rid), 1) FROM rows WHERE tbl=?", (tbl,)).fetchone()[0]
+        recs = []
+        for r, remote_row in zip(rows, remote_rows):
+            r = [_str(v) for v in r]
+            rid += 1
+            recs.append((tbl, rid, remote_row,
+                         r[i_stu] if i_stu is not None and i_stu < len(r) else None,
+                         r[i_date] if i_date is not None and i_date < len(r) else None,
+                         json.dumps(r, ensure_ascii=False)))
+        self._conn.executemany("INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?)", recs)
+
+    def _append(self, tbl, rows):
+        with self._lock, self._conn:
+            start = self._conn.execute("SELECT COUNT(*) FROM rows WHERE tbl=?", (tbl,)).fetchone()[0] + 2
+            self._insert(tbl, rows, [None] * len(rows))
+        return {"updates": {"updatedRange": f"{tbl}!A{start}:A{start + len(rows) - 1}", "updatedRows": len(rows)}}
+
+    def _update_cell(self, tbl, row, col, value):
+        with self._lock, self._conn:
+            hit = self._conn.execute("SELECT rid, remote_row, data FROM rows WHERE tbl=? ORDER BY rid LIMIT 1 OFFSET ?",
+                                     (tbl, row - 2)).fetchone()
+            if hit is None: raise IndexError(row)
+            rid, remote_row, data = hit
+            data = json.loads(data)
+            base = row_checksum(data)
+            data += [""] * (col - len(data))
+            data[col - 1] = _str(value)
+            self._conn.execute("UPDATE rows SET data=? WHERE tbl=? AND rid=?", (json.dumps(data, ensure_ascii=False), tbl, rid))
+            # 尚未送出的本地列會在 push 時整列送出，不需另外記錄
+            if remote_row is not None:
+                self._conn.execute("INSERT INTO updates (tbl, remote_row, col, value, base) VALUES (?, ?, ?, ?, ?)",
+                                   (tbl, remote_row, col, _str(value), base))
+
+    # --- 同步 ---
+    def _push(self, tbl):
+        # 由 sync 持 _sync_lock 呼叫；網路呼叫不持 _lock，只有讀寫 SQLite 時持鎖
+        ws = None
+        with self._lock:
+            ups = self._conn.execute("SELECT id, remote_row, col, value, base FROM updates WHERE tbl=? ORDER BY id", (tbl,)).fetchall()
+        for uid, remote_row, col, value, base in ups:
+            ws = ws or self.remote.worksheet(tbl)
+            # 樂觀鎖：遠端該列與本地修改前不同，代表其他人先改了，放棄本地修改並以遠端為準
+            if base and row_checksum(ws.row_values(remote_row)) != base:
+                with self._lock:
+                    hit = self._conn.execute("SELECT student FROM rows WHERE tbl=? AND remote_row=?", (tbl, remote_row)).fetchone()
+                self.conflicts.add(tbl, hit[0] if hit else None, f"{tbl} 第 {remote_row} 列已被其他人修改，本機修改已捨棄")
+            else: ws.update_cell(remote_row, col, value)
+            with self._lock, self._conn: self._conn.execute("DELETE FROM updates WHERE id=?", (uid,))
+        with self._lock:
+            dirty = self._conn.execute("SELECT rid, data FROM rows WHERE tbl=? AND remote_row IS NULL ORDER BY rid", (tbl,)).fetchall()
+        if not dirty: return
+        ws = ws or self.remote.worksheet(tbl)
+        resp = ws.append_rows([json.loads(d) for _, d in dirty])
+        m = re.search(r"![A-Z]+(\d+)", (resp or {}).get("updates", {}).get("updatedRange", ""))
+        if not m: return  # 無法得知遠端列號：留給下次整表比對
+        start = int(m.group(1))
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE rows SET remote_row=? WHERE tbl=? AND rid=?",
+                                   [(start + i, tbl, rid) for i, (rid, _) in enumerate(dirty)])
+
+    def _pull(self, tbl):
+        try: ws = self.remote.worksheet(tbl)
+        except TableNotFound: return False  # 例如尚未建立 Body_Composition
+        changed = False
+        with self._lock: meta = self._conn.execute("SELECT headers, next_remote FROM meta WHERE tbl=?", (tbl,)).fetchone()
+        rows = None
+        if tbl in HISTORY_TABLES and meta is not None:
+            # 只抓上次之後新增的遠端列；已由本地推送過的列號直接略過
+            headers, next_remote = json.loads(meta[0]), meta[1]
+            rows = ws.get_values(f"A{next_remote - 1}:ZZ") if next_remote > 2 else ws.get_values(f"A{next_remote}:ZZ")
+            if next_remote > 2:
+                with self._lock:
+                    last = self._conn.execute("SELECT data FROM rows WHERE tbl=? AND remote_row=?", (tbl, next_remote - 1)).fetchone()
+                if same_row(rows[0] if rows else [], json.loads(last[0]) if last else []): rows = rows[1:]
+                else: rows = None  # 遠端被刪過列，本地列號已對不上
+        if rows is not None:
+            with self._lock, self._conn:
+                known = {r for (r,) in self._conn.execute(
+                    "SELECT remote_row FROM rows WHERE tbl=? AND remote_row >= ?", (tbl, next_remote))}
+                new = [(next_remote + i, r) for i, r in enumerate(rows)
+                       if next_remote + i not in known and any(_str(v).strip() for v in r)]
+                if new:
+                    self._insert(tbl, [r[:len(headers)] for _, r in new], [n for n, _ in new])
+                    changed = True
+                self._conn.execute("UPDATE meta SET next_remote=? WHERE tbl=?", (next_remote + len(rows), tbl))
+        else:
+            values = ws.get_all_values()
+            with self._lock, self._conn:
+                pending = self._conn.execute("SELECT COUNT(*) FROM updates WHERE tbl=?", (tbl,)).fetchone()[0]
+                pending += self._conn.execute("SELECT COUNT(*) FROM rows WHERE tbl=? AND remote_row IS NULL", (tbl,)).fetchone()[0]
+                if pending: return False  # 本地還有未送出的修改，下輪再比對
+                local = self._values(tbl) if meta is not None else None
+                if local != [[_str(v) for v in r] for r in values]:
+                    headers = [_str(h) for h in values[0]] if values else []
+                    self._conn.execute("DELETE FROM rows WHERE tbl=?", (tbl,))
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, ?)",
+                                       (tbl, json.dumps(headers, ensure_ascii=False), len(values) + 1))
+                    self._insert(tbl, values[1:], range(2, len(values) + 1))
+                    changed = True
+        return changed
+
+    def sync(self, tables=ALL_TABLES):
+        """先推送本地修改再拉取遠端新資料；回傳有變動的表。"""
+        if self.remote is None: return []
+        changed = []
+        # 重整按鈕、背景執行緒與其他 session 可能同時呼叫，逐一進行
+        with self._sync_lock:
+            try:
+                for tbl in tables:
+                    if self._headers(tbl) is not None: self._push(tbl)
+                    if self._pull(tbl): changed.append(tbl)
+                self.online = True
+                self.last_error = ""
+                self.last_sync = time.time()
+            except Exception as e:
+                self.online = False
+                self.last_error = str(e)
+        if changed and self.on_change: self.on_change(*changed)
+        return changed
+
+    def start(self, interval=60):
+        if self._thread is not None or self.remote is None: return
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.sync()
+        self._thread = threading.Thread(target=loop, name="sqlite-mirror-sync", daemon=True)
+        self._thread.start()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+# 模組直接放在專案根目錄，測試從根目錄匯入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from storage import MemoryBackend
+
+HISTORY_HEADER = ["Date", "StudentID", "Plan", "Day", "Exercise", "Weight", "Reps", "Note"]
+
+
+@pytest.fixture
+def backend():
+    return MemoryBackend({
+        "History": [HISTORY_HEADER, ["2024-01-01", "Amy (1)", "P1", "W1D1", "Squat", "100", "5", ""]],
+        "Students": [["Name", "StudentID", "Memo"], ["Amy", "1", ""]],
+    })
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from analytics import HistoryAnalytics, prepare_sets
+from sheets_db import TableCache
+
+
+def test_rpe_only_from_sets_that_record_it():
+    df = pd.DataFrame({"Date": ["2024-01-01"] * 3, "StudentID": ["Amy (1)"] * 3, "Exercise": ["Squat"] * 3,
+                       "Weight": [100, 100, 100], "Reps": [5, 5, 5], "Note": ["", "RPE 8", "rpe:9.5"]})
+    sets = prepare_sets(df)
+    assert sets["e1rm_rpe"].isna().tolist() == [True, False, False]
+    assert sets["e1rm_rpe"].iloc[1] > sets["e1rm_epley"].iloc[1]
+
+
+def test_rpe_series_empty_without_rpe(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    analytics = HistoryAnalytics()
+    analytics.sync(table)
+    assert len(analytics.e1rm_series("Amy (1)", "Squat", "Epley")) == 1
+    assert analytics.e1rm_series("Amy (1)", "Squat", "RPE").empty
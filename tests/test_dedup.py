@@ -0,0 +1,60 @@
+from dedup import SignatureIndex
+from sheets_db import TableCache
+
+
+def _row(weight=100, reps=5, student="Amy (1)"):
+    return ["2024-01-01", student, "P1", "W1D1", "Squat", weight, reps, ""]
+
+
+def test_counts_existing_rows(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    index = SignatureIndex()
+    index.sync(table)
+    # History 已有一組 100x5：再送一組相同的略過，兩組則寫入第二組
+    assert index.filter_new([_row()]) == ([], 1)
+    rows, skipped = index.filter_new([_row(), _row()])
+    assert len(rows) == 1 and skipped == 1
+
+
+def test_pending_rows_count_until_synced(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    index = SignatureIndex()
+    index.sync(table)
+    assert index.filter_new([_row(weight="105")])[1] == 0
+    assert index.filter_new([_row(weight=105.0)])[1] == 1  # 尚未寫入的列也算
+
+    table.append_rows([_row(weight=105)])
+    index.sync(table)
+    assert len(index) == 2
+    assert index.filter_new([_row(weight=105)])[1] == 1
+
+
+def test_force_writes_everything(backend):
+    index = SignatureIndex()
+    index.sync(TableCache(backend.worksheet("History"), min_interval=0))
+    assert index.filter_new([_row(student="Bob (2)")] * 2, force=True) == ([_row(student="Bob (2)")] * 2, 0)
+
+
+def test_interleaved_save_is_not_a_duplicate():
+    import pandas as pd
+    from dedup import HISTORY_HEADERS, find_duplicates
+
+    amy = ["2024-01-01", "Amy (1)", "P1", "W1D1", "Squat", "100", "5", ""]
+    bob = ["2024-01-01", "Bob (2)", "P1", "W1D1", "Bench", "60", "8", ""]
+    df = pd.DataFrame([amy, bob, amy], columns=HISTORY_HEADERS, index=[2, 3, 4])
+    assert find_duplicates(df) == []
+    # 同一位學生換了另一堂課之後又出現一次相同的列，才是重複存檔
+    other = ["2024-01-02", "Amy (1)", "P1", "W1D2", "Bench", "50", "5", ""]
+    df = pd.DataFrame([amy, other, amy], columns=HISTORY_HEADERS, index=[2, 3, 4])
+    assert find_duplicates(df) == [4]
+
+
+def test_released_rows_can_be_saved_again(backend):
+    index = SignatureIndex()
+    index.sync(TableCache(backend.worksheet("History"), min_interval=0))
+    rows, _ = index.filter_new([_row(weight=105)])
+    assert index.filter_new([_row(weight=105)]) == ([], 1)
+    index.release(rows)  # 寫入失敗
+    assert index.filter_new([_row(weight=105)]) == ([_row(weight=105)], 0)
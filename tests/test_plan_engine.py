@@ -0,0 +1,81 @@
+import pandas as pd
+
+from plan_engine import expand_mesocycle, expand_sets, expand_team, history_rows
+
+# get_all_records 數值化之後的 Plan：整數、小數與無法轉換的字串混在一起
+PLAN = pd.DataFrame([
+    ["P1", "W1D1", 1, "Squat", 3, 5, 0.75, "慢下"],
+    ["P1", "W1D1", 2, "Bench", 2, 8, 0.7, ""],
+    ["P1", "W1D1", 3, "Plank", "", "30s", "-", ""],
+    ["P1", "W1D2", 1, "Deadlift", 1, 3, 0.85, ""],
+    ["P2", "W1D1", 1, "Squat", 5, 5, 0.8, ""],
+], columns=["Plan_Name", "Day", "Order", "Exercise", "Sets", "Reps", "Intensity", "Note"])
+
+
+def iterrows_sets(df_view, student_rm):
+    # 向量化之前的逐列展開，作為對照
+    final_rows = []
+    for _, row in df_view.iterrows():
+        rm = student_rm.get(row["Exercise"], 0)
+        try: w = int(rm * float(row["Intensity"]))
+        except: w = 0
+        try: sets_count = int(row['Sets'])
+        except: sets_count = 1
+        for i in range(1, sets_count + 1):
+            final_rows.append({
+                "選取": False, "編號": str(row["Order"]), "動作名稱": row["Exercise"],
+                "組數": f"Set {i}", "計畫次數": row["Reps"], "強度": str(row["Intensity"]),
+                "建議重量": w, "實際重量": None, "實際次數": row["Reps"], "備註": row.get("Note", "")
+            })
+    return final_rows
+
+
+def test_expand_sets_matches_iterrows():
+    rm = {"Squat": 140, "Bench": 97.5, "Deadlift": 180}
+    for plan, day in [("P1", "W1D1"), ("P1", "W1D2"), ("P2", "W1D1")]:
+        view = PLAN[(PLAN["Plan_Name"] == plan) & (PLAN["Day"] == day)]
+        assert expand_sets(view, rm).to_dict("records") == iterrows_sets(view, rm)
+    view = PLAN[PLAN["Plan_Name"] == "P1"].drop(columns="Note")
+    assert expand_sets(view, {}).to_dict("records") == iterrows_sets(view, {})
+
+
+def test_expand_mesocycle_days_in_order():
+    meso = expand_mesocycle(PLAN, "P1", {"Squat": 100})
+    assert list(meso) == ["W1D1", "W1D2"]
+    assert meso["W1D1"]["建議重量"].tolist() == [75, 75, 75, 0, 0, 0]
+
+
+def test_expand_team_per_student_weights_in_roster_order():
+    students = {"Amy (1)": {"rm": {"Squat": 100, "Bench": 60}}, "Bob (2)": {"rm": {}},
+                "Cai (3)": {"rm": {"Squat": "140"}}}
+    roster = ["Cai (3)", "Bob (2)", "Amy (1)"]
+    df = expand_team(PLAN, "P1", "W1D1", students, roster)
+    # 名單順序優先，同一位學生內依計畫列順序
+    assert df["學生"].tolist() == ["Cai (3)"] * 6 + ["Bob (2)"] * 6 + ["Amy (1)"] * 6
+    assert df["動作名稱"].tolist()[:6] == ["Squat"] * 3 + ["Bench"] * 2 + ["Plank"]
+    assert df.groupby("學生", sort=False)["建議重量"].first().to_dict() == {"Cai (3)": 105, "Bob (2)": 0, "Amy (1)": 75}
+    assert df.loc[df["學生"] == "Amy (1)", "建議重量"].tolist() == [75, 75, 75, 42, 42, 0]
+    # 每位學生的展開與單人展開相同
+    view = PLAN[(PLAN["Plan_Name"] == "P1") & (PLAN["Day"] == "W1D1")]
+    amy = df[df["學生"] == "Amy (1)"].drop(columns="學生").reset_index(drop=True)
+    pd.testing.assert_frame_equal(amy, expand_sets(view, students["Amy (1)"]["rm"]))
+    assert expand_team(PLAN, "P1", "W9D9", students, roster).columns.tolist() == df.columns.tolist()
+
+
+def test_history_rows_single_student_and_team():
+    df = expand_sets(PLAN[(PLAN["Plan_Name"] == "P1") & (PLAN["Day"] == "W1D1")], {"Squat": 100})
+    df.loc[0, "實際重量"] = 80
+    df.loc[1, "實際重量"] = 0
+    df.loc[1, "實際次數"] = 0   # 沒做的組
+    assert history_rows(df, "2024-01-02", "P1", "W1D1", student="Amy (1)") == [
+        ["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 80, 5, "慢下"],
+        ["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", None, 5, "慢下"],
+        ["2024-01-02", "Amy (1)", "P1", "W1D1", "Bench", None, 8, ""],
+        ["2024-01-02", "Amy (1)", "P1", "W1D1", "Bench", None, 8, ""],
+    ]
+
+    team = expand_team(PLAN, "P1", "W1D2", {}, ["Amy (1)", "Bob (2)"])
+    team["實際重量"] = [150, None]
+    team["實際次數"] = [3, None]
+    assert history_rows(team, "2024-01-02", "P1", "W1D2") == [["2024-01-02", "Amy (1)", "P1", "W1D2", "Deadlift", 150, 3, ""]]
+    assert history_rows(team.iloc[0:0], "2024-01-02", "P1", "W1D2") == []
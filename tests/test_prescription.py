@@ -0,0 +1,59 @@
+import datetime
+
+from prescription import E1RMIndex
+from sheets_db import TableCache
+from storage import MemoryBackend
+
+from conftest import HISTORY_HEADER
+
+
+def row(day, weight, reps, note=""):
+    return [str(day), "Amy (1)", "P1", "D1", "Squat", str(weight), str(reps), note]
+
+
+def test_submaximal_training_does_not_lower_prescription():
+    backend = MemoryBackend({"History": [HISTORY_HEADER]})
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    index = E1RMIndex()
+    start = datetime.date(2024, 1, 1)
+    rm = {"Squat": 100}
+    for week in range(6):
+        day = start + datetime.timedelta(weeks=week)
+        table.append_rows([row(day, rm["Squat"] * 0.75, 5)] * 5)
+        index.sync(table)
+        assert index.get("Amy (1)", "Squat", day) is not None
+        rm = index.merged_rm("Amy (1)", {"Squat": 100}, ["Squat"], day)
+    assert rm["Squat"] == 100
+
+
+def test_near_maximal_sets_raise_the_sheet_1rm():
+    backend = MemoryBackend({"History": [HISTORY_HEADER,
+                                         row("2024-01-01", 100, 3), row("2024-01-01", 100, 5, "RPE 6"),
+                                         row("2024-01-03", 90, 10)]})
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    index = E1RMIndex()
+    index.sync(table)
+    assert index.get("Amy (1)", "Squat") == 100 * (1 + 0.0333 * 3)
+    assert index.merged_rm("Amy (1)", {"Squat": "105"}, ["Squat"])["Squat"] == 109
+    assert index.merged_rm("Amy (1)", {"Squat": 120}, ["Squat"])["Squat"] == 120
+    assert index.get("Amy (1)", "Squat", datetime.date(2024, 6, 1)) is None
+
+
+def test_only_recent_days_kept():
+    rows = [row(datetime.date(2024, 1, 1) + datetime.timedelta(days=d), 100 + d, 1) for d in range(0, 200, 2)]
+    backend = MemoryBackend({"History": [HISTORY_HEADER] + rows})
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    index = E1RMIndex()
+    index.sync(table)
+    assert len(index._best[("Amy (1)", "Squat")]) <= index.max_age // 2 + 1
+    assert index.get("Amy (1)", "Squat") == 298 * (1 + 0.0333)
+    # 最佳那天超過 max_age 之後改用窗內的最大值
+    backend = MemoryBackend({"History": [HISTORY_HEADER, row("2024-01-01", 120, 1), row("2024-03-01", 100, 1)]})
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    index = E1RMIndex()
+    index.sync(table)
+    assert index.get("Amy (1)", "Squat", datetime.date(2024, 4, 15)) == 100 * (1 + 0.0333)
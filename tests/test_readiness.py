@@ -0,0 +1,44 @@
+import datetime
+
+import pytest
+
+from analytics import e1rm
+from readiness import ReadinessEngine
+from sheets_db import TableCache
+from storage import MemoryBackend
+
+from conftest import HISTORY_HEADER
+
+
+def history(rows):
+    table = TableCache(MemoryBackend({"History": [HISTORY_HEADER] + rows}).worksheet("History"), min_interval=0)
+    table.refresh()
+    return table
+
+
+def week(start, sets):
+    """每週一、三、五各練一次 Squat，sets 為每次的 (重量, 次數)。"""
+    return [[str(start + datetime.timedelta(days=d)), "Amy (1)", "P1", "D1", "Squat", str(w), str(r), ""]
+            for d in (0, 2, 4) for w, r in sets]
+
+
+def test_back_off_and_deload_sets_not_flagged_as_e1rm_drop():
+    start = datetime.date(2024, 1, 1)
+    work = [(60, 5), (100, 5), (80, 8), (80, 8)]   # 熱身、主項、退階組
+    rows = [r for w in range(8) for r in week(start + datetime.timedelta(weeks=w), work)]
+    rows += week(start + datetime.timedelta(weeks=8), [(60, 5), (100, 3), (60, 8), (60, 8)])  # 減量週
+    engine = ReadinessEngine()
+    engine.sync(history(rows))
+    r = engine.athlete("Amy (1)", start + datetime.timedelta(weeks=9), lifts=["Squat"])
+    assert r["trends"]["Squat"] > -0.05
+    assert not any("e1RM" in f for f in r["flags"])
+
+
+def test_better_set_later_replaces_days_best():
+    table = history([["2024-01-01", "Amy (1)", "P1", "D1", "Squat", "100", "5", ""]])
+    engine = ReadinessEngine()
+    engine.sync(table)
+    table.append_rows([["2024-01-01", "Amy (1)", "P1", "D1", "Squat", "80", "8", ""],
+                       ["2024-01-01", "Amy (1)", "P1", "D1", "Squat", "110", "5", ""]])
+    engine.sync(table)
+    assert engine.short.mean(("Amy (1)", "Squat")) == pytest.approx(e1rm(110, 5))
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from schema import concat_typed, select_rows, sort_by_student_date, typed_frame
+
+
+def _history(rows):
+    return typed_frame(pd.DataFrame(rows, columns=["Date", "StudentID", "Exercise", "Weight"]), "History")
+
+
+def test_concat_new_categories_stay_sorted():
+    old = _history([["2024-01-01", "Bob (2)", "Squat", "100"], ["2024-01-02", "Dan (4)", "Bench", "60"]])
+    new = _history([["2024-01-03", "Amy (1)", "Deadlift", "120"], ["2024-01-03", "Cai (3)", "Squat", "80"]])
+    df = concat_typed([old, new])
+    for c in ["StudentID", "Exercise"]:
+        assert isinstance(df[c].dtype, pd.CategoricalDtype)
+        cats = df[c].cat.categories.tolist()
+        assert cats == sorted(cats)
+        # codes 順序即字串順序，排序與二分搜尋都依賴這一點
+        assert (df[c].cat.codes.argsort(kind="stable").tolist()
+                == pd.Series(df[c].astype(str).tolist()).argsort(kind="stable").tolist())
+    assert df["StudentID"].astype(str).tolist() == ["Bob (2)", "Dan (4)", "Amy (1)", "Cai (3)"]
+    assert df["Weight"].dtype == "float32"
+
+
+def test_concat_known_categories_kept():
+    old = _history([["2024-01-01", "Amy (1)", "Squat", "100"], ["2024-01-02", "Bob (2)", "Bench", "60"]])
+    new = _history([["2024-01-03", "Bob (2)", "Squat", "105"]])
+    df = concat_typed([old, new])
+    assert df["StudentID"].cat.categories.tolist() == ["Amy (1)", "Bob (2)"]
+    assert df["Exercise"].astype(str).tolist() == ["Squat", "Bench", "Squat"]
+
+
+@pytest.fixture
+def frame():
+    return sort_by_student_date(_history([
+        ["2024-01-05", "Amy (1)", "Squat", "1"], ["", "Amy (1)", "Squat", "2"], ["bad", "Amy (1)", "Squat", "3"],
+        ["2024-01-01", "Amy (1)", "Squat", "4"], ["2024-01-10", "Bob (2)", "Squat", "5"],
+        ["2024-01-31", "Amy (1)", "Squat", "6"],
+    ]))
+
+
+@pytest.mark.parametrize("start, end, weights", [
+    (None, None, [4, 1, 6, 2, 3]),          # 不限日期時包含日期無效的列
+    ("2024-01-01", None, [4, 1, 6]),
+    (None, "2024-01-05", [4, 1]),           # end 當天也算
+    ("2024-01-02", "2024-01-30", [1]),
+    ("2024-02-01", None, []),
+])
+def test_select_rows_with_nat_dates(frame, start, end, weights):
+    assert select_rows(frame, "Amy (1)", start, end)["Weight"].tolist() == weights
+    # 與不指定學生時的遮罩結果一致
+    by_mask = select_rows(frame, None, start, end)
+    assert by_mask[by_mask["StudentID"] == "Amy (1)"]["Weight"].tolist() == weights
@@ -0,0 +1,118 @@
+from sheets_db import HistoryStore, TableCache
+
+
+def test_refresh_fetches_only_new_rows(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    backend.tables["History"].append_rows([["2024-01-02", "Bob (2)", "P1", "W1D1", "Bench", 60, 8, ""]])
+    table.refresh()
+    assert len(table.frame) == 2
+    assert table.frame["Weight"].tolist() == [100, 60]
+
+
+def test_staged_rows_visible_then_committed_once(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    table.stage("job1", [["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+    assert len(table.frame) == 2
+    assert len(backend.tables["History"].values) == 2
+
+    table.commit_staged(["job1"])
+    table.refresh(force=True)
+    assert len(backend.tables["History"].values) == 3
+    assert len(table.frame) == 2
+
+    table.discard("job1")
+    assert len(table.frame) == 2
+
+
+def test_changes_since_is_incremental(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    epoch, pos, rows, rebuild = table.changes_since(None, 0)
+    assert rebuild and len(rows) == 1
+    table.append_rows([["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+    epoch, pos, rows, rebuild = table.changes_since(epoch, pos)
+    assert not rebuild and rows["Weight"].tolist() == [105]
+
+
+def test_select_by_student_and_date(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    table.refresh()
+    table.append_rows([["2024-02-01", "Amy (1)", "P1", "W1D2", "Squat", 110, 3, ""],
+                       ["2024-01-15", "Bob (2)", "P1", "W1D1", "Bench", 60, 8, ""]])
+    assert table.select("Amy (1)", "2024-01-10", None)["Weight"].tolist() == [110]
+    assert table.select("Bob (2)")["Exercise"].tolist() == ["Bench"]
+    assert table.select("Nobody").empty
+
+
+def test_missing_table_cached_transient_error_retried(backend):
+    calls = []
+
+    class Flaky:
+        def worksheet(self, name):
+            calls.append(name)
+            if len(calls) == 1: raise ConnectionError("offline")
+            return backend.worksheet(name)
+
+    store = HistoryStore(Flaky())
+    assert store.table("History") is None
+    assert store.table("History") is not None
+    assert store.table("Body_Composition") is None
+    assert store.table("Body_Composition") is None
+    assert calls.count("Body_Composition") == 1
+
+
+def test_refresh_reloads_after_rows_deleted(backend):
+    table = TableCache(backend.worksheet("History"), min_interval=0)
+    remote = backend.tables["History"]
+    remote.append_rows([["2024-01-02", "Bob (2)", "P1", "W1D1", "Bench", 60, 8, ""]])
+    table.refresh()
+    epoch = table.changes_since(None, 0)[0]
+    del remote.values[1]
+    remote.append_rows([["2024-01-03", "Bob (2)", "P1", "W1D1", "Bench", 65, 8, ""]])
+    table.refresh(force=True)
+    assert table.frame["Weight"].tolist() == [60, 65]
+    assert table.changes_since(epoch, 0)[3]  # 下游需整批重建
+
+
+def test_conflict_log_scoped_and_expiring():
+    from sheets_db import ConflictLog
+
+    log = ConflictLog(ttl=60)
+    log.add("Students", "1", "Amy")
+    log.add("Students", "2", "Bob")
+    assert [c["message"] for c in log.take("1")] == ["Amy"]
+    assert log.take("1") == []
+    log.clear("Students")
+    assert len(log) == 0
+    log = ConflictLog(ttl=0)
+    log.add("Students", "1", "Amy")
+    assert len(log) == 0
+
+
+def test_prefetch_submits_once(backend):
+    import threading
+
+    started, release = threading.Event(), threading.Event()
+
+    class Slow:
+        def worksheet(self, name):
+            started.set()
+            release.wait(5)
+            return backend.worksheet(name)
+
+    class Executor:
+        def __init__(self): self.jobs = []
+        def submit(self, fn):
+            self.jobs.append(threading.Thread(target=fn))
+            self.jobs[-1].start()
+
+    store, pool = HistoryStore(Slow()), Executor()
+    store.prefetch("History", pool)
+    started.wait(5)
+    store.prefetch("History", pool)  # 讀取中：不再送出
+    release.set()
+    pool.jobs[0].join(5)
+    store.prefetch("History", pool)  # 已讀取：不再送出
+    assert len(pool.jobs) == 1 and store.table("History", load=False) is not None
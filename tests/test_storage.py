@@ -0,0 +1,80 @@
+import threading
+import time
+
+from storage import MemoryWorksheet, SQLiteMirror
+
+
+class SlowWorksheet(MemoryWorksheet):
+    # 讓 append 的網路呼叫期間有機會被另一個同步插隊
+    def append_rows(self, rows, **kwargs):
+        time.sleep(0.2)
+        return super().append_rows(rows, **kwargs)
+
+
+def test_push_appends_local_rows_once(backend, tmp_path):
+    mirror = SQLiteMirror(str(tmp_path / "m.sqlite"), backend)
+    mirror.worksheet("History").append_rows([["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+    assert mirror.status()["dirty"] == 1
+
+    mirror.sync(["History"])
+    mirror.sync(["History"])
+    assert len(backend.tables["History"].values) == 3
+    assert mirror.status()["dirty"] == 0
+    assert mirror.worksheet("History").get_all_values() == backend.tables["History"].values
+
+
+def test_concurrent_sync_does_not_duplicate(backend, tmp_path):
+    backend.tables["History"] = SlowWorksheet("History", backend.tables["History"].values)
+    mirror = SQLiteMirror(str(tmp_path / "m.sqlite"), backend)
+    mirror.worksheet("History").append_rows([["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+
+    threads = [threading.Thread(target=mirror.sync, args=(["History"],)) for _ in range(2)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(backend.tables["History"].values) == 3
+    assert len(mirror.worksheet("History").get_all_values()) == 3
+
+
+def test_pull_fetches_remote_rows(backend, tmp_path):
+    mirror = SQLiteMirror(str(tmp_path / "m.sqlite"), backend)
+    mirror.worksheet("History")
+    backend.tables["History"].append_rows([["2024-01-03", "Bob (2)", "P1", "W1D1", "Bench", 60, 8, ""]])
+    assert mirror.sync(["History"]) == ["History"]
+    assert mirror.worksheet("History").get_all_values()[-1][1] == "Bob (2)"
+
+
+def test_update_conflict_keeps_remote(backend, tmp_path):
+    mirror = SQLiteMirror(str(tmp_path / "m.sqlite"), backend)
+    mirror.worksheet("Students").update_cell(2, 3, "mine")
+    backend.tables["Students"].update_cell(2, 3, "theirs")
+    mirror.sync(["Students"])
+    assert backend.tables["Students"].values[1][2] == "theirs"
+    assert len(mirror.conflicts) == 1
+    # 只交給改了這位學生的畫面，顯示一次就移除
+    assert mirror.conflicts.take("2") == []
+    assert len(mirror.conflicts.take("001")) == 1
+    assert len(mirror.conflicts) == 0
+
+
+def test_pull_detects_deleted_remote_rows(backend, tmp_path):
+    mirror = SQLiteMirror(str(tmp_path / "m.sqlite"), backend)
+    remote = backend.tables["History"]
+    remote.append_rows([["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+    mirror.sync(["History"])
+    # 例如 dedup.py 刪掉第 2 列，之後又有新列
+    del remote.values[1]
+    remote.append_rows([["2024-01-03", "Bob (2)", "P1", "W1D1", "Bench", 60, 8, ""]])
+    mirror.sync(["History"])
+    assert mirror.worksheet("History").get_all_values() == remote.values
+
+
+def test_row_values_reads_one_row(backend, tmp_path):
+    mirror = SQLiteMirror(str(tmp_path / "m.sqlite"), backend)
+    ws = mirror.worksheet("History")
+    ws.append_rows([["2024-01-02", "Bob (2)", "P1", "W1D1", "Bench", 60, 8, ""]] * 3)
+    calls = []
+    values = mirror._values
+    mirror._values = lambda tbl, start=1, end=None: calls.append((start, end)) or values(tbl, start, end)
+    assert ws.row_values(1)[0] == "Date"
+    assert ws.row_values(3)[1] == "Bob (2)"
+    assert calls == [(1, 1), (3, 3)]
@@ -0,0 +1,67 @@
+import io
+
+import pandas as pd
+import pytest
+
+from dedup import HISTORY_HEADERS
+from storage import MemoryBackend
+from transfer import export_table, filter_chunk, import_file, iter_table, read_chunks, validate_chunk
+
+
+def _history(n):
+    # 偶數列是 Amy、奇數列是 Bob，日期從 2024-01-01 起每天一列
+    rows = [[f"2024-01-{d + 1:02d}", "Amy (1)" if d % 2 == 0 else "Bob (2)", "P1", "W1D1", "Squat", str(100 + d), "5", ""]
+            for d in range(n)]
+    return MemoryBackend({"History": [HISTORY_HEADERS] + rows}).worksheet("History")
+
+
+def test_validate_chunk_reports_source_lines_and_coerces_numbers():
+    df = pd.DataFrame({"Date": ["2024/01/02", "", "2024-01-03", "someday"],
+                       "StudentID": ["Amy (1)", "Amy (1)", "Bob (2)", "Bob (2)"],
+                       "Exercise": ["Squat", "Squat", "Bench", "Bench"],
+                       "Weight": ["100", "80", "62.5", "x"], "Reps": ["5", "5", "", "3"]})
+    rows, errors = validate_chunk(df, "History", HISTORY_HEADERS, first_line=10)
+    assert rows == [["2024-01-02", "Amy (1)", "", "", "Squat", 100, 5, ""],
+                    ["2024-01-03", "Bob (2)", "", "", "Bench", 62.5, "", ""]]
+    assert errors == ["第 11 行：Date 空白", "第 13 行：Date 不是日期；Weight 不是數字"]
+
+
+def test_validate_chunk_requires_columns():
+    with pytest.raises(ValueError, match="Exercise"):
+        validate_chunk(pd.DataFrame({"Date": ["2024-01-01"], "StudentID": ["Amy (1)"]}), "History", HISTORY_HEADERS)
+
+
+def test_import_file_counts_lines_across_chunks():
+    csv = "Date,StudentID,Exercise,Weight,Reps\n" + "".join(
+        f"2024-01-0{i + 1},Amy (1),Squat,{'bad' if i == 3 else 100 + i},5\n" for i in range(5))
+    batches = []
+    res = import_file(io.StringIO(csv), "History", batches.append, fmt="csv", chunksize=2)
+    assert [len(b) for b in batches] == [2, 1, 1]
+    assert res["imported"] == 4 and res["rejected"] == 1
+    assert res["errors"] == ["第 5 行：Weight 不是數字"]  # 標題在第 1 行
+
+
+def test_iter_table_chunk_boundaries():
+    assert [list(c.index) for c in iter_table(_history(5), chunk_rows=2)] == [[2, 3], [4, 5], [6]]
+    assert [list(c.index) for c in iter_table(_history(4), chunk_rows=2)] == [[2, 3], [4, 5]]
+    assert list(iter_table(_history(0), chunk_rows=2)) == []
+
+
+def test_filter_chunk_by_id_and_date():
+    df = pd.DataFrame({"StudentID": ["Amy (1)", "Amy (1)", "Bob (2)", "Amy (1)"],
+                       "Date": ["2024-01-01", "2024-01-31", "2024-01-15", "not a date"]})
+    out = filter_chunk(df, student="1", start="2024-01-01", end="2024-01-31")
+    assert out.index.tolist() == [0, 1]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_export_round_trip_filtered_across_chunks(tmp_path, fmt):
+    ws = _history(20)
+    dest = tmp_path / f"out.{fmt}"
+    n = export_table(ws, str(dest), student="Amy (1)", start="2024-01-03", end="2024-01-15", chunk_rows=4)
+    back = pd.concat(list(read_chunks(str(dest))), ignore_index=True)
+    assert n == len(back) == 7
+    assert back.columns.tolist() == HISTORY_HEADERS
+    assert back["Date"].tolist() == [f"2024-01-{d:02d}" for d in range(3, 16, 2)]
+    assert set(back["StudentID"]) == {"Amy (1)"}
+    assert back["Weight"].tolist() == [str(100 + d - 1) for d in range(3, 16, 2)]
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from sheets_db import HistoryStore, TableNotFound
+from write_queue import WriteQueue
+
+
+def _wait(queue, timeout=5):
+    end = time.time() + timeout
+    while queue.status()["pending"] and time.time() < end: time.sleep(0.02)
+
+
+def _wait_compacted(journal, timeout=5):
+    # 每批寫完、工作移出 pending 之後才壓縮 journal
+    end = time.time() + timeout
+    while journal.read_text() and time.time() < end: time.sleep(0.02)
+
+
+def test_appends_batched_and_journal_compacted(backend, tmp_path):
+    store = HistoryStore(backend, min_interval=0)
+    journal = tmp_path / "journal.jsonl"
+    queue = WriteQueue(backend, store, str(journal), linger=0.1)
+    queue.append_rows("History", [["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+    queue.append_rows("History", [["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 110, 3, ""]])
+    assert len(store.table("History").frame) == 3  # 暫存的列立即可見
+    _wait(queue)
+    assert len(backend.tables["History"].values) == 4
+    assert queue.status()["flushed"] == 2
+    _wait_compacted(journal)
+    assert journal.read_text() == ""
+
+
+def test_unknown_table_refused(backend, tmp_path):
+    queue = WriteQueue(backend, HistoryStore(backend), str(tmp_path / "journal.jsonl"), linger=0)
+    with pytest.raises(TableNotFound):
+        queue.append_rows("Body_Composition", [["2024-01-02", "Amy (1)", 70, 15, 30, ""]])
+
+
+def test_failed_job_parked(backend, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    queue = WriteQueue(backend, HistoryStore(backend), str(journal), linger=0)
+    queue.update_by_key("Students", 2, "999", 3, "memo")  # 找不到這位學生：不會重試成功
+    _wait(queue)
+    time.sleep(0.1)
+    assert queue.status()["failed"] == 1 and queue.status()["pending"] == 0
+    assert "999" in (tmp_path / "journal.jsonl.failed").read_text()
+    # 重啟後不再重播
+    assert WriteQueue(backend, HistoryStore(backend), str(journal), linger=0).status()["pending"] == 0
+
+
+class FlakyBackend:
+    """前 failures 次 worksheet() 丟出 ConnectionError，之後正常。"""
+
+    def __init__(self, backend, failures):
+        self.backend = backend
+        self.failures = failures
+
+    def worksheet(self, name):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("offline")
+        return self.backend.worksheet(name)
+
+
+def test_rows_enqueued_before_table_loaded_are_written(backend, tmp_path):
+    flaky = FlakyBackend(backend, failures=2)  # has_table 與 store.table 各失敗一次
+    store = HistoryStore(flaky, min_interval=0)
+    queue = WriteQueue(flaky, store, str(tmp_path / "journal.jsonl"), linger=0.1)
+    queue.append_rows("History", [["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]])
+    _wait(queue)
+    assert queue.status()["flushed"] == 1
+    assert backend.tables["History"].values[-1][5] == "105"
+    assert len(store.table("History").frame) == 2
+
+
+def test_journal_replayed_offline_is_written(backend, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    journal.write_text('{"id": "a", "kind": "append", "table": "History", '
+                       '"rows": [["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]]}\n')
+    flaky = FlakyBackend(backend, failures=1)  # 重播時讀不到表
+    queue = WriteQueue(flaky, HistoryStore(flaky, min_interval=0), str(journal), linger=0)
+    _wait(queue)
+    assert queue.status()["flushed"] == 1
+    assert len(backend.tables["History"].values) == 3
+
+
+def test_on_failed_called_for_parked_append(backend, tmp_path):
+    def refuse(rows, **kwargs): raise ValueError("bad range")
+    backend.tables["History"].append_rows = refuse  # 非暫時性錯誤：不重試
+    failed = []
+    queue = WriteQueue(backend, HistoryStore(backend, min_interval=0), str(tmp_path / "journal.jsonl"), linger=0)
+    queue.append_rows("History", [["2024-01-02", "Amy (1)", "P1", "W1D1", "Squat", 105, 5, ""]], on_failed=lambda: failed.append(1))
+    queue.append_rows("Students", [["Bob", "2", ""]], on_failed=lambda: failed.append(2))
+    _wait(queue)
+    time.sleep(0.1)
+    assert failed == [1]
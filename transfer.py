@@ -0,0 +1,198 @@
+"""History / Plan / Body_Composition 的批次匯入與匯出（CSV / Parquet，分塊串流）。
+
+匯入時逐塊讀檔、驗證後以一次 append_rows 寫入一塊；匯出時以列範圍分段讀取工作表，
+篩選後逐塊寫出，整份資料不會同時放在記憶體。
+
+命令列用法（讀取 .streamlit/secrets.toml 的服務帳號）：
+    python transfer.py import History logs_2023.csv
+    python transfer.py import Plan plans.parquet --chunk 1000
+    python transfer.py export History out.parquet --student "Amy (001)" --start 2024-01-01 --end 2024-06-30
+"""
+import argparse
+import os
+
+import pandas as pd
+
+from dedup import HISTORY_HEADERS
+from sheets_db import column_letter
+
+PLAN_HEADERS = ["Plan_Name", "Day", "Order", "Exercise", "Sets", "Reps", "Intensity", "Note"]
+BODY_HEADERS = ["Date", "StudentID", "Weight", "Fat", "Muscle", "Note"]
+
+# headers: 預設欄位順序；required: 不可空白；numeric: 空白或數字；dates: 可解析的日期
+SCHEMAS = {
+    "History": {"headers": HISTORY_HEADERS, "required": ["Date", "StudentID", "Exercise"],
+                "numeric": ["Weight", "Reps"], "dates": ["Date"]},
+    "Plan": {"headers": PLAN_HEADERS, "required": ["Plan_Name", "Day", "Exercise"],
+             "numeric": ["Order", "Sets"], "dates": []},
+    "Body_Composition": {"headers": BODY_HEADERS, "required": ["Date", "StudentID"],
+                         "numeric": ["Weight", "Fat", "Muscle"], "dates": ["Date"]},
+}
+FORMATS = ("csv", "parquet")
+
+
+def file_format(name, fmt=None):
+    fmt = fmt or os.path.splitext(str(name))[1].lstrip(".").lower()
+    if fmt not in FORMATS: raise ValueError(f"不支援的格式：{fmt or name}（僅支援 csv / parquet）")
+    return fmt
+
+
+def read_chunks(src, fmt=None, chunksize=500):
+    """逐塊讀取 CSV / Parquet，每塊為全字串欄位的 DataFrame（空值為 ""）。src 可為路徑或檔案物件。"""
+    fmt = file_format(getattr(src, "name", src), fmt)
+    if fmt == "csv":
+        yield from pd.read_csv(src, chunksize=chunksize, dtype=str, keep_default_na=False)
+        return
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(src).iter_batches(batch_size=chunksize):
+        df = batch.to_pandas()
+        yield df.astype(object).where(df.notna(), "").astype(str)
+
+
+def _number(v):
+    f = float(v)
+    return int(f) if f.is_integer() else f
+
+
+def validate_chunk(df, table, headers, first_line=2):
+    """回傳 (可寫入的列, 錯誤訊息)。first_line 為這一塊第一列在來源檔的行號，錯誤訊息以它標示位置。"""
+    schema = SCHEMAS[table]
+    df = df.rename(columns=lambda c: str(c).strip())
+    missing = [c for c in schema["required"] if c not in df.columns]
+    if missing: raise ValueError(f"{table} 缺少必要欄位：{', '.join(missing)}")
+    df = df.reindex(columns=headers, fill_value="").apply(lambda s: s.astype(str).str.strip())
+
+    problems = pd.Series("", index=df.index)
+    for c in schema["required"]:
+        problems = problems.where(df[c] != "", problems + f"{c} 空白；")
+    for c in schema["dates"]:
+        d = pd.to_datetime(df[c], errors="coerce", format="mixed")
+        problems = problems.where(d.notna() | (df[c] == ""), problems + f"{c} 不是日期；")
+        df[c] = d.dt.strftime("%Y-%m-%d").where(d.notna(), df[c])
+    for c in schema["numeric"]:
+        if c not in df.columns: continue
+        n = pd.to_numeric(df[c], errors="coerce")
+        problems = problems.where(n.notna() | (df[c] == ""), problems + f"{c} 不是數字；")
+
+    ok = problems == ""
+    numeric = [headers.index(c) for c in schema["numeric"] if c in headers]
+    rows = df[ok].to_numpy().tolist()
+    for r in rows:
+        for i in numeric:
+            if r[i] != "": r[i] = _number(r[i])
+    lines = first_line + pd.RangeIndex(len(df))[~ok.to_numpy()]
+    errors = [f"第 {line} 行：{msg.rstrip('；')}" for line, msg in zip(lines, problems[~ok])]
+    return rows, errors
+
+
+def import_file(src, table, sink, headers=None, fmt=None, chunksize=500, on_chunk=None, max_errors=100):
+    """驗證後逐塊呼叫 sink(rows)；headers 為工作表實際的標題列（預設為 SCHEMAS 的欄位）。
+
+    回傳 {"imported": 筆數, "rejected": 筆數, "errors": [前 max_errors 則錯誤]}。
+    """
+    headers = [h for h in (headers or SCHEMAS[table]["headers"]) if h]
+    result = {"imported": 0, "rejected": 0, "errors": []}
+    line = 2
+    for chunk in read_chunks(src, fmt, chunksize):
+        rows, errors = validate_chunk(chunk, table, headers, line)
+        line += len(chunk)
+        if rows: sink(rows)
+        result["imported"] += len(rows)
+        result["rejected"] += len(errors)
+        result["errors"] += errors[:max_errors - len(result["errors"])]
+        if on_chunk: on_chunk(result)
+    return result
+
+
+# ==========================================
+# 匯出
+# ==========================================
+def iter_table(ws, chunk_rows=5000, headers=None):
+    """以 A{r}:{末欄}{r+n-1} 分段讀取工作表，逐塊回傳 DataFrame（index 為工作表列號）。"""
+    headers = headers or [str(h).strip() for h in ws.row_values(1)]
+    if not headers: return
+    end_col = column_letter(len(headers))
+    n, start = len(headers), 2
+    while True:
+        values = ws.get_values(f"A{start}:{end_col}{start + chunk_rows - 1}")
+        if not values: return
+        yield pd.DataFrame([(list(r) + [""] * n)[:n] for r in values], columns=headers,
+                           index=range(start, start + len(values)))
+        if len(values) < chunk_rows: return
+        start += chunk_rows
+
+
+def filter_chunk(df, student=None, start=None, end=None):
+    # student 可給完整的 "姓名 (ID)" 或只給 ID
+    if student and "StudentID" in df:
+        sid = df["StudentID"].astype(str)
+        df = df[(sid == student) | sid.str.endswith(f"({student})")]
+    if (start or end) and "Date" in df:
+        d = pd.to_datetime(df["Date"], errors="coerce", format="mixed")
+        mask = d.notna()
+        if start: mask &= d >= pd.Timestamp(start)
+        if end: mask &= d <= pd.Timestamp(end)
+        df = df[mask]
+    return df
+
+
+def export_table(ws, dest, fmt=None, student=None, start=None, end=None, chunk_rows=5000):
+    """把工作表篩選後逐塊寫到 dest（路徑），回傳寫出的筆數。欄位一律存成字串，與工作表內容一致。"""
+    fmt = file_format(dest, fmt)
+    headers = [str(h).strip() for h in ws.row_values(1)]
+    chunks = (filter_chunk(c, student, start, end) for c in iter_table(ws, chunk_rows, headers))
+    written = 0
+    if fmt == "csv":
+        with open(dest, "w", encoding="utf-8", newline="") as f:
+            pd.DataFrame(columns=headers).to_csv(f, index=False)
+            for chunk in chunks:
+                chunk.to_csv(f, index=False, header=False)
+                written += len(chunk)
+        return written
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(h, pa.string()) for h in headers])
+    with pq.ParquetWriter(dest, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk.astype(str), schema=schema, preserve_index=False))
+            written += len(chunk)
+    return written
+
+
+def main():
+    from storage import sheets_backend_from_secrets
+
+    parser = argparse.ArgumentParser(description="Coach_System_DB 批次匯入 / 匯出")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_imp = sub.add_parser("import", help="CSV / Parquet 匯入 History、Plan 或 Body_Composition")
+    p_imp.add_argument("table", choices=list(SCHEMAS))
+    p_imp.add_argument("path")
+    p_imp.add_argument("--chunk", type=int, default=500, help="每次 append_rows 的列數")
+    p_imp.add_argument("--dry-run", action="store_true", help="只驗證，不寫入")
+    p_exp = sub.add_parser("export", help="匯出任一張表為 CSV / Parquet")
+    p_exp.add_argument("table")
+    p_exp.add_argument("path")
+    p_exp.add_argument("--student")
+    p_exp.add_argument("--start")
+    p_exp.add_argument("--end")
+    p_exp.add_argument("--chunk", type=int, default=5000, help="每次讀取的列數")
+    args = parser.parse_args()
+
+    backend = sheets_backend_from_secrets(args.secrets)
+    ws = backend.worksheet(args.table)
+    if args.cmd == "import":
+        sink = (lambda rows: None) if args.dry_run else ws.append_rows
+        res = import_file(args.path, args.table, sink, headers=ws.row_values(1), chunksize=args.chunk,
+                          on_chunk=lambda r: print(f"\r已匯入 {r['imported']} 筆，略過 {r['rejected']} 筆", end="", flush=True))
+        print()
+        for e in res["errors"]: print("  " + e)
+        if args.dry_run: print("（dry run，未寫入）")
+    else:
+        n = export_table(ws, args.path, student=args.student, start=args.start, end=args.end, chunk_rows=args.chunk)
+        print(f"已匯出 {n} 筆到 {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import collections
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+
+from sheets_db import ConflictLog, TableNotFound, WriteConflict, row_checksum
+
+# 429 = 每分鐘配額用完，5xx 為 Google 端暫時錯誤，都值得重試
+RETRY_CODES = {429, 500, 502, 503, 504}
+FAILED_TTL = 600  # 失敗的寫入在狀態列顯示多久（秒）
+
+log = logging.getLogger("coach_app.write_queue")
+
+
+def _cell(v):
+    # data_editor 給的是 numpy 型別與 NaN，轉成可寫入 JSON / Sheets 的值
+    if hasattr(v, "item"): v = v.item()
+    if v is None or (isinstance(v, float) and math.isnan(v)): return ""
+    return v
+
+
+def _is_transient(e):
+    from gspread.exceptions import APIError  # 只有寫入出錯時才載入 gspread
+    if isinstance(e, APIError): return e.code in RETRY_CODES
+    return isinstance(e, (ConnectionError, TimeoutError, OSError))
+
+
+class WriteQueue:
+    """寫入 Google Sheets 的背景佇列（write-behind）。
+
+    存檔時只寫 journal 並把列暫存到 HistoryStore 的快取，畫面立即更新；
+    背景執行緒把同一張表的多筆 append 合併成一次 API 呼叫，遇到配額錯誤以
+    指數退避重試。journal 在程序重啟後重播尚未完成的工作（至少一次送達）。
+    非暫時性錯誤不重試：工作記進 <journal>.failed 後移出佇列，不再重播。
+    """
+
+    def __init__(self, sheet, store, journal_path, maxsize=500, linger=0.5, max_backoff=60, on_flush=None):
+        self.sheet = sheet
+        self.store = store
+        self.journal_path = journal_path
+        self.linger = linger
+        self.max_backoff = max_backoff
+        self.on_flush = on_flush
+        self._q = queue.Queue(maxsize)
+        self._jobs = {}  # 尚未完成的工作 id -> job
+        self._on_failed = {}  # 工作 id -> 寫入失敗時呼叫的函式（不寫進 journal，重啟後不保留）
+        self._lock = threading.Lock()
+        self.flushed = 0
+        self.api_calls = 0
+        self.failed = collections.deque(maxlen=50)  # 最近放棄的工作 {"table", "message", "time"}
+        self._tables = set()  # 確認過存在的工作表
+        self.conflicts = ConflictLog()  # 樂觀鎖檢查失敗、已放棄的修改，依學生 key 取出
+        self.last_error = ""
+        self.last_flush = None
+        self._replay()
+        threading.Thread(target=self._run, name="sheets-write-behind", daemon=True).start()
+
+    # --- journal ---
+    def _journal(self, entry):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path): return
+        pending = {}
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try: entry = json.loads(line)
+                except ValueError: continue  # 寫到一半被中斷的最後一行
+                if "done" in entry: pending.pop(entry["done"], None)
+                else: pending[entry["id"]] = entry
+        for job in pending.values():
+            self._stage(job)
+            self._jobs[job["id"]] = job
+            self._q.put(job)
+        self._compact()
+
+    def _compact(self):
+        # 只保留未完成的工作，避免 journal 無限成長（每批寫完都做，不等佇列清空）
+        with self._lock:
+            tmp = self.journal_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for job in self._jobs.values(): f.write(json.dumps(job, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.journal_path)
+
+    # --- 對外介面 ---
+    def _stage(self, job):
+        if job["kind"] == "append" and self.store.table(job["table"]) is not None:
+            self.store.table(job["table"]).stage(job["id"], job["rows"])
+
+    def _enqueue(self, job, on_failed=None):
+        with self._lock:
+            self._journal(job)
+            self._jobs[job["id"]] = job
+            if on_failed: self._on_failed[job["id"]] = on_failed
+        self._stage(job)
+        try: self._q.put(job, timeout=5)
+        except queue.Full:
+            self._done(job["id"], failed=True)
+            raise
+        return job["id"]
+
+    def has_table(self, table):
+        """工作表是否存在；確認存在的表記住不再查詢，連線錯誤時當作存在（寫入失敗會重試）。"""
+        if table in self._tables: return True
+        try: self.sheet.worksheet(table)
+        except TableNotFound: return False
+        except Exception: return True
+        self._tables.add(table)
+        return True
+
+    def append_rows(self, table, rows, on_failed=None):
+        """排入一筆 append；on_failed 在這筆工作放棄（非暫時性錯誤、佇列已滿）時呼叫。"""
+        rows = [[_cell(v) for v in r] for r in rows]
+        if not rows: return None
+        if not self.has_table(table): raise TableNotFound(table)
+        return self._enqueue({"id": uuid.uuid4().hex, "kind": "append", "table": table, "rows": rows}, on_failed)
+
+    def update_by_key(self, table, key_col, key, col, value, expected=None):
+        """以 key_col 欄找到 key 所在列後更新第 col 欄（例如以 StudentID 更新 Memo）。
+
+        expected 為讀取時該列的 row_checksum；寫入前若列內容已變（其他教練先改了）
+        就放棄這筆修改並記入 conflicts，不覆蓋別人的資料。
+        """
+        return self._enqueue({"id": uuid.uuid4().hex, "kind": "update", "table": table, "key_col": key_col,
+                              "key": str(key), "col": col, "value": _cell(value), "expected": expected})
+
+    def status(self):
+        failed = [f for f in list(self.failed) if time.time() - f["time"] < FAILED_TTL]
+        return {"pending": len(self._jobs), "flushed": self.flushed, "failed": len(failed),
+                "conflicts": len(self.conflicts),
+                "api_calls": self.api_calls, "last_error": self.last_error, "last_flush": self.last_flush}
+
+    # --- 背景執行緒 ---
+    def _done(self, job_id, failed=False):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            on_failed = self._on_failed.pop(job_id, None)
+            self._journal({"done": job_id})
+        if job and job["kind"] == "append" and self.store.table(job["table"]) is not None:
+            self.store.table(job["table"]).discard(job_id)
+        if failed and on_failed:
+            try: on_failed()
+            except Exception: log.exception("on_failed callback for %s raised", job_id)
+
+    def _apply(self, kind, table, jobs):
+        if kind == "append":
+            tbl = self.store.table(table)
+            if tbl is not None:
+                # 排入時表還沒讀到（例如離線、重啟後重播）的工作沒有暫存，寫出前補上
+                for j in jobs: tbl.stage(j["id"], j["rows"])
+                tbl.commit_staged([j["id"] for j in jobs])
+            else:
+                # 沒有快取的表（例如匯入 Plan）直接合併成一次 append
+                rows = [r for j in jobs for r in j["rows"]]
+                self.sheet.worksheet(table).append_rows(rows)
+            self.api_calls += 1
+        else:
+            ws = self.sheet.worksheet(table)
+            for j in jobs:
+                ids = ws.col_values(j["key_col"])
+                self.api_calls += 1
+                if j["key"] not in ids: raise KeyError(j["key"])
+                row = ids.index(j["key"]) + 1
+                if j.get("expected"):
+                    self.api_calls += 1
+                    if row_checksum(ws.row_values(row)) != j["expected"]:
+                        raise WriteConflict(f"{table} {j['key']} 已被其他人修改")
+                ws.update_cell(row, j["col"], j["value"])
+                self.api_calls += 1
+
+    def _flush_group(self, kind, table, jobs):
+        delay = 1
+        while True:
+            try:
+                self._apply(kind, table, jobs)
+                break
+            except WriteConflict as e:
+                # 衝突不重試：保留對方的版本，由畫面提示重新整理
+                for j in jobs: self.conflicts.add(table, j.get("key"), str(e))
+                for j in jobs: self._done(j["id"], failed=True)
+                return
+            except Exception as e:
+                self.last_error = f"{table}: {e}"
+                if not _is_transient(e):
+                    self._park(jobs, self.last_error)
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        # 先計入 flushed 再移出 pending，status() 不會出現兩邊都沒算到的瞬間
+        self.flushed += len(jobs)
+        self.last_flush = time.time()
+        for j in jobs: self._done(j["id"])
+        if self.on_flush: self.on_flush(table)
+
+    def _park(self, jobs, error):
+        # 非暫時性錯誤重試也不會成功：記到 .failed 供人工處理，移出佇列與畫面上的暫存
+        log.error("write failed, parked %d job(s): %s", len(jobs), error)
+        with open(self.journal_path + ".failed", "a", encoding="utf-8") as f:
+            for j in jobs: f.write(json.dumps({**j, "error": error, "time": time.time()}, ensure_ascii=False) + "\n")
+        for j in jobs:
+            self.failed.append({"table": j["table"], "message": error, "time": time.time()})
+            self._done(j["id"], failed=True)
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            time.sleep(self.linger)  # 稍等一下，讓同時存檔的其他教練併進同一批
+            while True:
+                try: batch.append(self._q.get_nowait())
+                except queue.Empty: break
+            groups = {}
+            for job in batch:
+                # append 依表合併；update 逐筆處理，衝突只影響自己
+                gkey = (job["kind"], job["table"], job["id"] if job["kind"] == "update" else None)
+                if job["id"] in self._jobs: groups.setdefault(gkey, []).append(job)
+            for (kind, table, _), jobs in groups.items():
+                self._flush_group(kind, table, jobs)
+            self._compact()